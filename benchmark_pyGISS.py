@@ -0,0 +1,508 @@
+import argparse
+import glob
+import json
+import numpy as np
+import platform
+import pyproj
+import shapefile
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tkinter as tk
+from os.path import basename, join
+from extended_pyGISS import Controller, GeometryCache, Layer, Map, ShpReader, path_app
+
+class Event():
+
+    def __init__(self, x, y, delta=0):
+        self.x, self.y, self.delta = x, y, delta
+
+class CanvasStandIn(tk.Canvas):
+
+    # Stand-in for the tk canvas, used when no display is available (e.g on
+    # a server without Xvfb). The Map methods work unchanged on top of it:
+    # items are stored with their coordinates, so that the cost of creating,
+    # moving and scaling items still grows with the number of vertices.
+
+    def __init__(self, master, **options):
+        self.master = master
+        self.items, self.last_id = {}, 0
+        self.width, self.height = options.get('width', 1), options.get('height', 1)
+        self.view = [0, 0]
+        self.pending, self.last_job = {}, 0
+
+    def create_item(self, coords, options):
+        if len(coords) == 1:
+            coords = coords[0]
+        self.last_id += 1
+        tags = options.pop('tags', ())
+        tags = (tags,) if isinstance(tags, str) else tuple(tags)
+        self.items[self.last_id] = [list(coords), tags, options]
+        return self.last_id
+
+    def create_polygon(self, *coords, **options):
+        return self.create_item(coords, options)
+
+    create_rectangle = create_oval = create_line = create_polygon
+    create_image = create_text = create_polygon
+
+    def find_withtag(self, tag):
+        if isinstance(tag, int):
+            return (tag,) if tag in self.items else ()
+        return tuple(id for id, (_, tags, _) in self.items.items()
+                                                if tag == 'all' or tag in tags)
+
+    def delete(self, *tags):
+        for tag in tags:
+            for id in self.find_withtag(tag):
+                del self.items[id]
+
+    def coords(self, tag, *coords):
+        ids = self.find_withtag(tag)
+        if not ids:
+            return []
+        if coords:
+            if len(coords) == 1:
+                coords = coords[0]
+            self.items[ids[0]][0] = list(coords)
+        return self.items[ids[0]][0]
+
+    def itemconfig(self, tag, **options):
+        for id in self.find_withtag(tag):
+            self.items[id][2].update(options)
+
+    itemconfigure = itemconfig
+
+    def itemcget(self, tag, option):
+        return self.items[self.find_withtag(tag)[0]][2].get(option, '')
+
+    def gettags(self, tag):
+        ids = self.find_withtag(tag)
+        return self.items[ids[0]][1] if ids else ()
+
+    def addtag_withtag(self, new_tag, tag):
+        for id in self.find_withtag(tag):
+            self.items[id][1] += (new_tag,)
+
+    def dtag(self, tag, removed_tag=None):
+        for id in self.find_withtag(tag):
+            self.items[id][1] = tuple(t for t in self.items[id][1]
+                                            if t != (removed_tag or tag))
+
+    def move(self, tag, dx, dy):
+        for id in self.find_withtag(tag):
+            coords = self.items[id][0]
+            coords[0::2] = [x + dx for x in coords[0::2]]
+            coords[1::2] = [y + dy for y in coords[1::2]]
+
+    def scale(self, tag, x0, y0, x_factor, y_factor):
+        for id in self.find_withtag(tag):
+            coords = self.items[id][0]
+            coords[0::2] = [x0 + (x - x0)*x_factor for x in coords[0::2]]
+            coords[1::2] = [y0 + (y - y0)*y_factor for y in coords[1::2]]
+
+    def find_closest(self, x, y):
+        return min(self.items, key=lambda id: (self.items[id][0][0] - x)**2
+                                            + (self.items[id][0][1] - y)**2),
+
+    def find_enclosed(self, x0, y0, x1, y1):
+        return tuple(id for id, (coords, _, _) in self.items.items()
+                    if min(x0, x1) <= min(coords[0::2]) <= max(coords[0::2]) <= max(x0, x1)
+                    and min(y0, y1) <= min(coords[1::2]) <= max(coords[1::2]) <= max(y0, y1))
+
+    def find_overlapping(self, x0, y0, x1, y1):
+        return tuple(id for id, (coords, _, _) in self.items.items()
+                    if min(coords[0::2]) <= x1 and max(coords[0::2]) >= x0
+                    and min(coords[1::2]) <= y1 and max(coords[1::2]) >= y0)
+
+    def canvasx(self, x):
+        return x + self.view[0]
+
+    def canvasy(self, y):
+        return y + self.view[1]
+
+    def scan_mark(self, x, y):
+        self.mark = x, y
+
+    def scan_dragto(self, x, y, gain=10):
+        self.view[0] -= (x - self.mark[0])*gain
+        self.view[1] -= (y - self.mark[1])*gain
+        self.mark = x, y
+
+    def winfo_width(self):
+        return self.width
+
+    def winfo_height(self):
+        return self.height
+
+    def bbox(self, *tags):
+        return 0, 0, self.width, self.height
+
+    def after(self, delay, function=None, *args):
+        self.last_job += 1
+        self.pending[self.last_job] = function, args
+        return self.last_job
+
+    def after_idle(self, function, *args):
+        return self.after(0, function, *args)
+
+    def after_cancel(self, id):
+        self.pending.pop(id, None)
+
+    def update(self):
+        pending, self.pending = self.pending, {}
+        for function, args in pending.values():
+            function(*args)
+
+    update_idletasks = update
+
+    def tag_raise(self, *args, **options):
+        pass
+
+    tag_lower = bind = tag_bind = configure = config = pack = tag_raise
+
+class ControllerStandIn():
+
+    def __init__(self):
+        self.menu = ControllerStandIn.Menu()
+        self.node_image = self.selected_node_image = None
+        self.drag_and_drop = False
+
+    class Menu():
+        progress_bar, import_status, join_status = {}, {}, {}
+
+        def show_layers(self, layers):
+            pass
+
+class StandInMap(Map, CanvasStandIn):
+
+    pass
+
+def create_map(backend):
+    if backend in ('auto', 'tk'):
+        try:
+            controller = Controller(path_app)
+            controller.update()
+            return controller.map, 'tk'
+        except tk.TclError:
+            if backend == 'tk':
+                raise
+    return StandInMap(ControllerStandIn()), 'stand-in'
+
+def settle(gis_map):
+    # process the pending events until the shapefile, layer and node imports,
+    # and the reprojection, are over
+    gis_map.update()
+    while (gis_map.stream_job or gis_map.layer_job or gis_map.node_job 
+                                                or gis_map.projection_job):
+        time.sleep(0.001)
+        gis_map.update()
+
+class Benchmark():
+
+    def __init__(self, repeat):
+        self.repeat = repeat
+        self.results = []
+
+    def measure(self, name, function, setup=None, repeat=None, **parameters):
+        timings = []
+        for _ in range(repeat or self.repeat):
+            if setup:
+                setup()
+            start = time.perf_counter()
+            counts = function()
+            timings.append(time.perf_counter() - start)
+        result = dict(
+                      benchmark = name,
+                      runs = len(timings),
+                      min = min(timings),
+                      median = statistics.median(timings),
+                      **parameters,
+                      **(counts or {})
+                      )
+        self.results.append(result)
+        print('{:<22}{:<40}{:>10.4f}s'.format(name, ' '.join('{}={}'.format(*p)
+                                    for p in parameters.items()), result['min']))
+
+# the peak memory usage of a shapefile load is measured in a new process, 
+# whose peak resident set size is reset after the imports (Linux only)
+peak_rss_script = '''
+import json, re, sys
+import shapefile
+from headless_pyGISS import HeadlessMap
+from extended_pyGISS import ShpReader
+# pyproj is imported and the projection is built on first use: before the reset
+HeadlessMap.projections['Mercator']
+def status(key):
+    with open('/proc/self/status') as file:
+        return int(re.search(key + r':\\s+(\\d+)', file.read()).group(1))
+filepath, native = sys.argv[1], sys.argv[2] == 'mmap'
+with open('/proc/self/clear_refs', 'w') as file:
+    file.write('5')
+before = status('VmRSS')
+headless_map = HeadlessMap(filepath)
+headless_map.sort_layer(*headless_map.project_shapes(ShpReader(filepath, native)))
+print(json.dumps((status('VmHWM') - before)/2**10))
+'''
+
+def peak_rss(filepath, reader):
+    # increase of the peak resident set size (in MB, on Linux) of a process 
+    # that loads the shapefile, or None if it cannot be measured
+    try:
+        output = subprocess.check_output([sys.executable, '-c', peak_rss_script, 
+                            filepath, reader], cwd=path_app, stderr=subprocess.DEVNULL)
+        return json.loads(output)
+    except (OSError, subprocess.CalledProcessError, ValueError):
+        return None
+
+# the startup is measured in a new process: import of the extended version,
+# and creation of the window when a display is available
+startup_script = '''
+import json, time
+start = time.perf_counter()
+import extended_pyGISS
+imported = time.perf_counter() - start
+try:
+    controller = extended_pyGISS.Controller(extended_pyGISS.path_app)
+    controller.update()
+    window = time.perf_counter() - start
+except extended_pyGISS.tk.TclError:
+    window = None
+print(json.dumps({'import': imported, 'window': window}))
+'''
+
+def startup():
+    # duration of the import and of the creation of the window (in seconds)
+    output = subprocess.check_output([sys.executable, '-c', startup_script], 
+                                        cwd=path_app, stderr=subprocess.DEVNULL)
+    return json.loads(output)
+
+def shapefile_benchmarks(benchmark, gis_map, shapefiles):
+    for filepath in shapefiles:
+        name = basename(filepath)
+        benchmark.measure('parse', lambda: {'shapes': len(
+                    shapefile.Reader(filepath).shapes())}, shapefile=name)
+        # the memory-mapped reader is compared to pyshp, from the file to 
+        # the projected layer
+        for reader in ('pyshp', 'mmap'):
+            rss = peak_rss(filepath, reader)
+            benchmark.measure('load', lambda: {'vertices': len(gis_map.sort_layer(
+                    *gis_map.project_shapes(ShpReader(filepath, reader == 'mmap')))[0]),
+                    'peak_rss': rss}, shapefile=name, reader=reader)
+            print('{:<22}{:<40}{}'.format('peak_rss', 'shapefile={} reader={}'.format(
+                    name, reader), 'n/a' if rss is None else '{:9.1f}MB'.format(rss)))
+        shapes = list(ShpReader(filepath))
+        for proj in gis_map.projections:
+            gis_map.proj = proj
+            benchmark.measure('projection', lambda: {'vertices': len(
+                    gis_map.project_shapes(shapes)[0])}, shapefile=name, projection=proj)
+        gis_map.proj = 'Mercator'
+        gis_map.layers = [Layer(filepath)]
+
+        def draw(cache):
+            if not cache:
+                gis_map.cache = GeometryCache()
+            gis_map.draw_map()
+            settle(gis_map)
+            return {'items': len(gis_map.find_withtag('land'))}
+
+        benchmark.measure('draw_map', lambda: draw(False), shapefile=name, cache='cold')
+        benchmark.measure('draw_map', lambda: draw(True), shapefile=name, cache='warm')
+
+        def zoom(factor):
+            # 30 zoom steps centered on the middle of the canvas: from the 
+            # initial ratio, zooming out goes through all levels of detail
+            for _ in range(30):
+                gis_map.zoomer(Event(650, 400), factor)
+            return {'items': len(gis_map.find_withtag('land'))}
+
+        benchmark.measure('zoom_out', lambda: zoom(0.7), repeat=1, shapefile=name)
+        benchmark.measure('zoom_in', lambda: zoom(1/0.7), repeat=1, shapefile=name)
+
+        def switch(cache):
+            for proj in tuple(gis_map.projections) + ('Mercator',):
+                if not cache:
+                    gis_map.cache = GeometryCache()
+                gis_map.proj = proj
+                gis_map.draw_map()
+                settle(gis_map)
+
+        benchmark.measure('projection_switch', lambda: switch(False),
+                                                shapefile=name, cache='cold')
+        benchmark.measure('projection_switch', lambda: switch(True),
+                    setup=lambda: switch(True), shapefile=name, cache='warm')
+
+        def request(cache):
+            # projection changes from the menu: the reprojection runs in a
+            # worker thread, only the swap blocks the GUI
+            blocking = 0
+            for proj in tuple(gis_map.projections) + ('Mercator',):
+                if not cache:
+                    gis_map.cache = GeometryCache()
+                start = time.perf_counter()
+                gis_map.request_projection(proj)
+                blocking += time.perf_counter() - start
+                while gis_map.projection_future and not gis_map.projection_future.done():
+                    time.sleep(0.001)
+                start = time.perf_counter()
+                settle(gis_map)
+                blocking += time.perf_counter() - start
+            return {'blocking': blocking}
+
+        benchmark.measure('projection_request', lambda: request(False),
+                                                shapefile=name, cache='cold')
+        benchmark.measure('projection_request', lambda: request(True),
+                    setup=lambda: request(True), shapefile=name, cache='warm')
+    gis_map.delete_map()
+
+    def overlay():
+        # all shapefiles overlaid: they are read in parallel by the layer pool
+        gis_map.delete_map()
+        gis_map.cache = GeometryCache()
+        gis_map.add_layers(shapefiles)
+        settle(gis_map)
+        return {'items': len(gis_map.find_withtag('land'))}
+
+    def toggle():
+        # the bottom layer is hidden and shown again, without being read
+        for _ in range(2):
+            gis_map.toggle_layer(0)
+        return {'items': len(gis_map.find_withtag('land'))}
+
+    benchmark.measure('add_layers', overlay, layers=len(shapefiles))
+    benchmark.measure('toggle_layer', toggle, layers=len(shapefiles))
+    gis_map.delete_map()
+
+def node_benchmarks(benchmark, gis_map, nodes_file, counts):
+    def reset():
+        gis_map.selected_nodes.clear()
+        for node in gis_map.node_id_to_node.values():
+            gis_map.delete(node.id, node.label_id)
+        gis_map.node_id_to_node.clear()
+        # the view is centered on France, where the synthetic nodes are
+        gis_map.proj, gis_map.ratio = 'Mercator', 1e-3
+        px, py = gis_map.projections['Mercator'](2, 47)
+        gis_map.offset = 650 - px*gis_map.ratio, 400 + py*gis_map.ratio
+
+    def import_nodes(filepath):
+        gis_map.load_nodes(filepath)
+        settle(gis_map)
+        return {'items': len(gis_map.node_id_to_node)}
+
+    benchmark.measure('import_nodes', lambda: import_nodes(nodes_file),
+                            setup=reset, file=basename(nodes_file))
+    # synthetic nodes are drawn at random in metropolitan France
+    random = np.random.default_rng(0)
+    for count in counts:
+        longitudes = random.uniform(-4.5, 8, count)
+        latitudes = random.uniform(42.5, 51, count)
+
+        def create():
+            for x, y in zip(*gis_map.to_canvas_coordinates(longitudes, latitudes)):
+                gis_map.create_object(x, y)
+
+        benchmark.measure('create_nodes', create, setup=reset, repeat=1, nodes=count)
+        with tempfile.TemporaryDirectory() as directory:
+            csv_file = join(directory, 'nodes.csv')
+            np.savetxt(csv_file, np.column_stack((longitudes, latitudes)), 
+                fmt='%.6f', delimiter=',', header='longitude,latitude', comments='')
+            benchmark.measure('import_csv', lambda: import_nodes(csv_file),
+                                        setup=reset, repeat=1, nodes=count)
+        benchmark.measure('redraw_nodes', gis_map.redraw_nodes, nodes=count)
+        benchmark.measure('zoom_with_nodes',
+                    lambda: gis_map.zoomer(Event(650, 400), 0.7), nodes=count)
+        benchmark.measure('update_labels', gis_map.update_labels, nodes=count)
+        benchmark.measure('pick_node', lambda: {'items': int(
+                    gis_map.node_at(650, 400) is not None)}, nodes=count)
+        benchmark.measure('select_area', lambda: {'items': len(
+                    gis_map.nodes_in_area(450, 200, 850, 600))}, nodes=count)
+        benchmark.measure('nodes_within', lambda: {'items': len(
+                    gis_map.nodes_within(2, 47, 100))}, nodes=count, km=100)
+
+        def start_drag():
+            gis_map.select_objects(*gis_map.node_id_to_node.values())
+            node = next(iter(gis_map.node_id_to_node.values()))
+            gis_map.find_closest_node(Event(node.x, node.y))
+            return node
+
+        node = start_drag()
+
+        def drag():
+            # 10 frames of 10 motion events each, with all the nodes selected
+            for frame in range(10):
+                for step in range(1, 11):
+                    gis_map.node_motion(Event(x + 10*frame + step, y + step))
+                gis_map.update()
+
+        x, y = node.x, node.y
+        benchmark.measure('node_drag', drag, repeat=1, nodes=count, events=100)
+        benchmark.measure('node_drop', lambda: gis_map.end_point_select_nodes(
+                                Event(x + 100, y + 10)), repeat=1, nodes=count)
+    reset()
+
+def environment(backend):
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+                    cwd=path_app, stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+            'backend': backend,
+            'commit': commit,
+            'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'machine': platform.machine(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'pyproj': pyproj.__version__,
+            'python': platform.python_version()
+            }
+
+def compare(results, reference_file):
+    with open(reference_file) as file:
+        reference = json.load(file)['results']
+    key = lambda r: tuple(sorted((k, str(v)) for k, v in r.items()
+                if k not in ('min', 'median', 'runs', 'items', 'shapes', 'vertices',
+                                    'peak_rss', 'blocking', 'import', 'window')))
+    reference = {key(result): result for result in reference}
+    print('\n{:<62}{:>10}{:>10}{:>8}'.format('benchmark', 'before', 'after', 'ratio'))
+    for result in results:
+        if key(result) in reference:
+            before = reference[key(result)]['min']
+            print('{:<62}{:>9.4f}s{:>9.4f}s{:>7.2f}x'.format(
+                ' '.join(str(v) for k, v in sorted(key(result))),
+                before, result['min'], before/max(result['min'], 1e-9)))
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description='Benchmark PyGISS')
+    parser.add_argument('-o', '--output', default='benchmark_results.json',
+                                            help='JSON file of the results')
+    parser.add_argument('-c', '--compare', help='JSON file of a previous run')
+    parser.add_argument('-b', '--backend', choices=('auto', 'tk', 'stand-in'),
+                                                            default='auto')
+    parser.add_argument('-r', '--repeat', type=int, default=3)
+    parser.add_argument('-s', '--shapefiles', nargs='*',
+                        default=sorted(glob.glob(join(path_app, 'shapefiles', '*.shp'))))
+    parser.add_argument('-n', '--nodes', nargs='*', type=int,
+                                        default=(10000, 100000, 1000000),
+                                        help='number of synthetic nodes')
+    args = parser.parse_args(arguments)
+    gis_map, backend = create_map(args.backend)
+    benchmark = Benchmark(args.repeat)
+    benchmark.measure('startup', startup)
+    for stage in ('import', 'window'):
+        duration = benchmark.results[-1][stage]
+        print('{:<62}{}'.format('startup ' + stage, 
+                        'n/a' if duration is None else '{:9.4f}s'.format(duration)))
+    shapefile_benchmarks(benchmark, gis_map, args.shapefiles)
+    node_benchmarks(benchmark, gis_map, join(path_app, 'import', 'french cities.xls'),
+                                                                    args.nodes)
+    with open(args.output, 'w') as file:
+        json.dump({'environment': environment(backend),
+                            'results': benchmark.results}, file, indent=2)
+    if args.compare:
+        compare(benchmark.results, args.compare)
+
+if str.__eq__(__name__, '__main__'):
+    main()
@@ -1,23 +1,70 @@
+import base64
+import csv
+import importlib.util
+import io
+import json
+import multiprocessing
+import os
+import struct
 import sys
+import tempfile
+import threading
+import time
 import tkinter as tk
 import warnings
+from bisect import bisect, insort
+from collections import OrderedDict
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import cached_property, wraps
+from hashlib import sha1
 from inspect import stack
-from os.path import abspath, dirname, pardir, join
-from PIL import ImageTk
+from itertools import islice
+from os.path import abspath, basename, dirname, pardir, join
 from tkinter import ttk, filedialog
-try:
-    import pyproj
-    import shapefile
-    import shapely.geometry
-except ImportError:
+
+class LazyModule():
+    
+    # A module that is imported when one of its attributes is first used, 
+    # so that the window is shown before the heavy libraries are loaded:
+    # e.g pyshp and shapely are imported with the first shapefile, xlrd with
+    # the first node file, and Pillow by the thread that loads the node 
+    # images. The attributes are then cached in the proxy.
+    
+    def __init__(self, name):
+        self.name = name
+        
+    def __getattr__(self, attribute):
+        value = getattr(importlib.import_module(self.name), attribute)
+        setattr(self, attribute, value)
+        return value
+        
+# only the presence of the libraries is checked at startup
+if any(importlib.util.find_spec(name) is None 
+                    for name in ('numpy', 'PIL', 'pyproj', 'shapefile', 'shapely')):
     from tkinter import messagebox
     tk.messagebox.showinfo('Some libraries are missing', 
-                    'Pyproj, Shapefile and Shapely are required (see README)')
+                    'Numpy, Pillow, Pyproj, Shapefile and Shapely are required (see README)')
     sys.exit(1)
-try:
-    import xlrd
-except ImportError:
+import numpy as np
+pyproj = LazyModule('pyproj')
+shapefile = LazyModule('shapefile')
+shapely = LazyModule('shapely')
+Image = LazyModule('PIL.Image')
+ImageDraw = LazyModule('PIL.ImageDraw')
+ImageTk = LazyModule('PIL.ImageTk')
+# the Excel readers are optional: the node import only offers the file types
+# whose reader is installed
+if importlib.util.find_spec('xlrd') is None:
     warnings.warn('Excel libraries missing: excel import/export disabled')
+    xlrd = None
+else:
+    xlrd = LazyModule('xlrd')
+if importlib.util.find_spec('openpyxl') is None:
+    openpyxl = None
+else:
+    openpyxl = LazyModule('openpyxl')
     
 # prevent python from writing *.pyc files / __pycache__ folders
 sys.dont_write_bytecode = True
@@ -34,21 +81,17 @@ class Controller(tk.Tk):
         self.title('Extended PyGISS: A full-on GIS software')
         path_icon = abspath(join(path_app, 'images'))
         
-        # generate the PSF tk images
-        img_psf = ImageTk.Image.open(join(
-                                          path_icon, 
-                                          'node.png'
-                                          )
-                                    )
-                                    
-        selected_img_psf = ImageTk.Image.open(join(
-                                          path_icon, 
-                                          'selected_node.png'
-                                          )
-                                    )
-        self.psf_button_image = ImageTk.PhotoImage(img_psf.resize((100, 100)))
-        self.node_image = ImageTk.PhotoImage(img_psf.resize((40, 40)))
-        self.selected_node_image = ImageTk.PhotoImage(selected_img_psf.resize((40, 40)))
+        # generate the PSF tk images: they are created empty, and filled 
+        # once the PNG files are decoded and resized by a background thread
+        # (plain tk images, so that Pillow is not imported before the window
+        # is shown)
+        self.psf_button_image = tk.PhotoImage(width=100, height=100)
+        self.node_image = tk.PhotoImage(width=40, height=40)
+        self.selected_node_image = tk.PhotoImage(width=40, height=40)
+        image_pool = ThreadPoolExecutor(max_workers=1)
+        self.image_future = image_pool.submit(self.load_images, path_icon)
+        image_pool.shutdown(wait=False)
+        self.after(20, self.poll_images)
         
         for widget in (
                        'Button',
@@ -76,6 +119,33 @@ class Controller(tk.Tk):
         self.image = None
         self.bind_all('<B1-Motion>', lambda _:_)
 
+    def load_images(self, path_icon):
+        # runs in the worker thread: no tk images. The resized images are 
+        # encoded in PNG, which tk decodes when the tk images are filled.
+        img_psf, selected_img_psf = (Image.open(join(path_icon, name)) 
+                                for name in ('node.png', 'selected_node.png'))
+        images = []
+        for image in (
+                      img_psf.resize((100, 100)), 
+                      img_psf.resize((40, 40)), 
+                      selected_img_psf.resize((40, 40))
+                      ):
+            buffer = io.BytesIO()
+            image.save(buffer, 'png')
+            images.append(base64.b64encode(buffer.getvalue()).decode('ascii'))
+        return images
+                
+    def poll_images(self):
+        if not self.image_future.done():
+            self.after(20, self.poll_images)
+            return
+        for photo, image in zip((
+                                 self.psf_button_image, 
+                                 self.node_image, 
+                                 self.selected_node_image
+                                 ), self.image_future.result()):
+            photo.configure(data=image, format='png')
+        
     def stop_drag_and_drop(self, event):
         self.drag_and_drop = False
         
@@ -108,6 +178,10 @@ class Menu(tk.Frame):
                             command=controller.map.import_nodes, width=20)
         import_nodes_button.grid(row=2, column=0, pady=5, in_=lf_creation)
         
+        # number of nodes imported, and import speed
+        self.import_status = ttk.Label(self, width=30, anchor='center')
+        self.import_status.grid(row=3, column=0, in_=lf_creation)
+        
         lf_projection = ttk.Labelframe(
                                        self, 
                                        text = 'Projection management', 
@@ -139,42 +213,1102 @@ class Menu(tk.Frame):
                             command=controller.map.delete_selected_nodes, width=20)
         delete_selection.grid(row=1, column=0, pady=5, in_=lf_map_management)
         
+        # progress of the import of a shapefile
+        self.progress_bar = ttk.Progressbar(self, length=150)
+        self.progress_bar.grid(row=2, column=0, pady=5, in_=lf_map_management)
+        
+        # the land and water are drawn as a single image in raster mode
+        self.raster_mode = tk.BooleanVar()
+        raster_button = ttk.Checkbutton(self, text='Raster base layer',
+                    variable = self.raster_mode, 
+                    command = lambda: controller.map.set_raster_mode(
+                                                        self.raster_mode.get()))
+        raster_button.grid(row=3, column=0, pady=5, in_=lf_map_management)
+        
+        lf_layers = ttk.Labelframe(
+                                   self, 
+                                   text = 'Layers', 
+                                   padding = (6, 6, 12, 12)
+                                   )
+        lf_layers.grid(row=3, column=0, padx=5, pady=5)
+        
+        # layers of the map, the top layer first
+        self.map = controller.map
+        self.layer_list = ttk.Treeview(self, height=4, columns=('visible',),
+                                                            selectmode='browse')
+        self.layer_list.heading('#0', text='shapefile')
+        self.layer_list.heading('visible', text='visible')
+        self.layer_list.column('#0', width=150)
+        self.layer_list.column('visible', width=50, anchor='center')
+        self.layer_list.grid(row=0, column=0, columnspan=2, in_=lf_layers)
+        
+        for index, (text, command) in enumerate((
+                                    ('Show / hide', self.toggle_layer),
+                                    ('Remove', self.remove_layer),
+                                    ('Move up', lambda: self.move_layer(1)),
+                                    ('Move down', lambda: self.move_layer(-1))
+                                    )):
+            layer_button = ttk.Button(self, text=text, command=command, width=10)
+            layer_button.grid(row=1 + index//2, column=index%2, 
+                                                    pady=5, in_=lf_layers)
+        
+        lf_spatial_join = ttk.Labelframe(
+                                         self, 
+                                         text = 'Spatial join', 
+                                         padding = (6, 6, 12, 12)
+                                         )
+        lf_spatial_join.grid(row=4, column=0, padx=5, pady=5)
+        
+        join_button = ttk.Button(self, text='Join nodes to map',
+                            command=controller.map.spatial_join, width=20)
+        join_button.grid(row=0, column=0, pady=5, in_=lf_spatial_join)
+        
+        export_join_button = ttk.Button(self, text='Export join',
+                            command=controller.map.export_join, width=20)
+        export_join_button.grid(row=1, column=0, pady=5, in_=lf_spatial_join)
+        
+        # number of nodes assigned to a shape, and duration of the join
+        self.join_status = ttk.Label(self, width=30, anchor='center')
+        self.join_status.grid(row=2, column=0, in_=lf_spatial_join)
+        
+        lf_performance = ttk.Labelframe(
+                                        self, 
+                                        text = 'Performance', 
+                                        padding = (6, 6, 12, 12)
+                                        )
+        lf_performance.grid(row=5, column=0, padx=5, pady=5)
+        
+        self.stats = controller.map.stats
+        self.record_stats = tk.BooleanVar()
+        self.stats_job = None
+        record_button = ttk.Checkbutton(self, text='Record timings',
+                    variable=self.record_stats, command=self.toggle_stats)
+        record_button.grid(row=0, column=0, columnspan=2, in_=lf_performance)
+        
+        # one row per operation, with its latency histogram as children
+        self.stats_tree = ttk.Treeview(self, height=8, 
+                            columns=('calls', 'mean', 'max', 'counts'))
+        for column, text, width in (
+                                    ('#0', 'operation', 120),
+                                    ('calls', 'calls', 45),
+                                    ('mean', 'mean (ms)', 65),
+                                    ('max', 'max (ms)', 65),
+                                    ('counts', 'counts', 140)
+                                    ):
+            self.stats_tree.heading(column, text=text)
+            self.stats_tree.column(column, width=width, stretch=False)
+        self.stats_tree.grid(row=1, column=0, columnspan=2, in_=lf_performance)
+        
+        clear_stats = ttk.Button(self, text='Reset', 
+                            command=self.clear_stats, width=9)
+        clear_stats.grid(row=2, column=0, pady=5, in_=lf_performance)
+        
+        export_stats = ttk.Button(self, text='Export JSON',
+                            command=self.export_stats, width=11)
+        export_stats.grid(row=2, column=1, pady=5, in_=lf_performance)
+        
+    def selected_layer(self):
+        selection = self.layer_list.selection()
+        return int(selection[0]) if selection else None
+        
+    def show_layers(self, layers):
+        selection = self.selected_layer()
+        self.layer_list.delete(*self.layer_list.get_children())
+        for index, layer in reversed(list(enumerate(layers))):
+            self.layer_list.insert('', 'end', iid=str(index), 
+                                text=basename(layer.filepath), 
+                                values=('yes' if layer.visible else 'no',))
+        if selection is not None and selection < len(layers):
+            self.layer_list.selection_set(str(selection))
+            
+    def toggle_layer(self):
+        index = self.selected_layer()
+        if index is not None:
+            self.map.toggle_layer(index)
+            
+    def remove_layer(self):
+        index = self.selected_layer()
+        if index is not None:
+            self.map.remove_layer(index)
+            
+    def move_layer(self, step):
+        index = self.selected_layer()
+        if index is not None:
+            self.layer_list.selection_set(str(self.map.move_layer(index, step)))
+        
+    def toggle_stats(self):
+        self.stats.enabled = self.record_stats.get()
+        if self.stats_job:
+            self.after_cancel(self.stats_job)
+        self.stats_job = None
+        if self.stats.enabled:
+            self.refresh_stats()
+            
+    def refresh_stats(self):
+        # the panel is refreshed every second while the timings are recorded
+        self.stats_job = None
+        self.stats_tree.delete(*self.stats_tree.get_children())
+        for name, operation in self.stats.summary():
+            item = self.stats_tree.insert('', 'end', text=name, values=(
+                        operation['calls'],
+                        '{:.2f}'.format(1000*operation['total']/operation['calls']),
+                        '{:.2f}'.format(1000*operation['max']),
+                        ' '.join('{}={}'.format(*count) 
+                                    for count in operation['counts'].items())
+                        ))
+            for label, calls in zip(self.stats.bucket_labels(), 
+                                                    operation['histogram']):
+                if calls:
+                    self.stats_tree.insert(item, 'end', text=label, values=(calls,))
+        if self.stats.enabled:
+            self.stats_job = self.after(1000, self.refresh_stats)
+            
+    def clear_stats(self):
+        self.stats.clear()
+        self.stats_tree.delete(*self.stats_tree.get_children())
+        
+    def export_stats(self):
+        filepath = filedialog.asksaveasfilename(
+                                                defaultextension = '.json',
+                                                filetypes = (('json files', '*.json'),)
+                                                )
+        if filepath:
+            self.stats.dump(filepath)
+        
+def read_node_chunks(filepath, chunk_size=1000):
+    # The longitude and latitude of the nodes are in the first two columns 
+    # of a CSV file or of the first sheet of an Excel file, below a header 
+    # row. The rows are read by chunks: for each chunk, the generator yields
+    # the coordinates (N x 2 array, NaN for the cells that are not numbers), 
+    # and the fraction of the file that was read.
+    extension = os.path.splitext(filepath)[1].lower()
+    if extension != '.csv' and (openpyxl if extension == '.xlsx' else xlrd) is None:
+        warnings.warn('{} files cannot be read: {} is missing'.format(extension, 
+                            'openpyxl' if extension == '.xlsx' else 'xlrd'))
+        return
+    if extension == '.csv':
+        with open(filepath, newline='') as file:
+            try:
+                dialect = csv.Sniffer().sniff(file.read(4096), delimiters=',;\t')
+            except csv.Error:
+                dialect = csv.excel
+            file.seek(0)
+            size = max(os.path.getsize(filepath), 1)
+            reader = csv.reader(file, dialect)
+            next(reader, None)
+            while True:
+                rows = list(islice(reader, chunk_size))
+                if not rows:
+                    return
+                yield to_coordinates(rows), file.buffer.tell()/size
+    elif extension == '.xlsx':
+        book = openpyxl.load_workbook(filepath, read_only=True, data_only=True)
+        sheet = book.worksheets[0]
+        count = max(sheet.max_row or 1, 1)
+        rows = sheet.iter_rows(min_row=2, max_col=2, values_only=True)
+        read = 1
+        try:
+            while True:
+                chunk = list(islice(rows, chunk_size))
+                if not chunk:
+                    return
+                read += len(chunk)
+                yield to_coordinates(chunk), min(read/count, 1)
+        finally:
+            book.close()
+    else:
+        book = xlrd.open_workbook(filepath)
+        try:
+            sheet = book.sheet_by_index(0)
+        # if the sheet cannot be found, there's nothing to import
+        except xlrd.biffh.XLRDError:
+            warnings.warn('the excel file is empty: import failed')
+            return
+        for start in range(1, sheet.nrows, chunk_size):
+            end = min(start + chunk_size, sheet.nrows)
+            yield to_coordinates(list(zip(
+                                          sheet.col_values(0, start, end), 
+                                          sheet.col_values(1, start, end)
+                                          ))), end/sheet.nrows
+                
+def to_coordinates(rows):
+    # the first two cells of each row, as floats
+    try:
+        return np.array([row[:2] for row in rows], dtype=float).reshape(-1, 2)
+    except (ValueError, TypeError):
+        coords = np.full((len(rows), 2), np.nan)
+        for i, row in enumerate(rows):
+            for j, cell in enumerate(row[:2]):
+                try:
+                    coords[i, j] = float(cell)
+                except (ValueError, TypeError):
+                    pass
+        return coords
+        
+class Instrumentation():
+    
+    # Timings of the hot paths of the map, recorded only when enabled: for 
+    # each operation, the number of calls, the total and maximum durations, 
+    # counts (e.g vertices projected or items created), and a histogram of 
+    # the durations. Operations may be recorded by worker threads.
+    
+    # upper bounds (in milliseconds) of the histogram buckets
+    buckets = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+    
+    def __init__(self):
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.operations = {}
+        
+    @contextmanager
+    def measure(self, name):
+        # the block can add counts to the dictionary it receives
+        counts = {}
+        start = time.perf_counter()
+        try:
+            yield counts
+        finally:
+            self.record(name, time.perf_counter() - start, **counts)
+            
+    def record(self, name, duration, **counts):
+        if not self.enabled:
+            return
+        with self.lock:
+            operation = self.operations.setdefault(name, {
+                                    'calls': 0, 
+                                    'total': 0., 
+                                    'max': 0., 
+                                    'counts': {},
+                                    'histogram': [0]*(len(self.buckets) + 1)
+                                    })
+            operation['calls'] += 1
+            operation['total'] += duration
+            operation['max'] = max(operation['max'], duration)
+            operation['histogram'][bisect(self.buckets, 1000*duration)] += 1
+            for key, value in counts.items():
+                operation['counts'][key] = operation['counts'].get(key, 0) + value
+                
+    def bucket_labels(self):
+        bounds = (0,) + self.buckets
+        return ['{}-{} ms'.format(*bucket) for bucket in zip(bounds, bounds[1:])
+                                        ] + ['> {} ms'.format(self.buckets[-1])]
+                
+    def summary(self):
+        # copy of the operations, sorted by name
+        with self.lock:
+            return [(name, dict(operation, counts=dict(operation['counts']), 
+                                    histogram=list(operation['histogram']))) 
+                    for name, operation in sorted(self.operations.items())]
+                    
+    def clear(self):
+        with self.lock:
+            self.operations = {}
+            
+    def dump(self, filepath):
+        with open(filepath, 'w') as file:
+            json.dump({
+                       'buckets': self.bucket_labels(), 
+                       'operations': dict(self.summary())
+                       }, file, indent=2)
+        
+def timed(name):
+    # decorator of the map methods whose duration is recorded
+    def decorator(function):
+        @wraps(function)
+        def wrapper(self, *args, **kwargs):
+            with self.stats.measure(name):
+                return function(self, *args, **kwargs)
+        return wrapper
+    return decorator
+        
+def column(name):
+    # property of a node view, stored in one of the arrays of the node store
+    return property(
+                    lambda node: getattr(node.store, name)[node.row].item(),
+                    lambda node, value: getattr(node.store, name).__setitem__(
+                                                                node.row, value)
+                    )
+        
 class PSF_Object():
     
+    # a node is a view on a row of the node store: it has no __dict__, and 
+    # two views of the same row are equal (e.g for the set of selected nodes)
+    __slots__ = ('store', 'row')
+    
     type = 'node'
+    
+    id = column('id')
+    label_id = column('label_id')
+    x, y = column('x'), column('y')
+    longitude, latitude = column('longitude'), column('latitude')
+    region = column('region')
+        
+    def __init__(self, store, row):
+        self.store = store
+        self.row = row
+        
+    def __eq__(self, other):
+        return self.store is other.store and self.row == other.row
+        
+    def __hash__(self):
+        return self.row
+        
+class NodeStore():
+    
+    # The nodes are stored in parallel arrays (canvas IDs of the node and its
+    # label, canvas and geographical coordinates), indexed by a row ID: this 
+    # allows all nodes to be projected with a single vectorized call. 
+    # The store is a mapping (node ID -> node view), like a dictionnary.
+    # Labels are only created for visible nodes: the label ID of the other
+    # nodes is 0. Likewise, the region of the nodes that are not in any shape
+    # of the map (or that were not joined to the map) is 0.
+    
+    columns = (
+               ('id', np.int64), 
+               ('label_id', np.int64), 
+               ('x', float), 
+               ('y', float), 
+               ('longitude', float), 
+               ('latitude', float),
+               # projected coordinates, used by the spatial index
+               ('px', float),
+               ('py', float),
+               # index + 1 of the shape that contains the node (spatial join)
+               ('region', np.int64),
+               # whether the text of the label must be updated
+               ('stale', bool)
+               )
+    
+    def __init__(self, capacity=1024):
+        for name, dtype in self.columns:
+            setattr(self, name, np.zeros(capacity, dtype=dtype))
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.id_to_row = {}
+        # rows of deleted nodes, reused for the next nodes
+        self.free_rows = []
+        self.size = 0
+        self.index = NodeIndex(self)
+        
+    def grow(self):
+        # the capacity is doubled when all rows are used
+        for name, _ in self.columns + (('alive', bool),):
+            array = getattr(self, name)
+            setattr(self, name, np.concatenate((array, np.zeros_like(array))))
+            
+    def add(self, id, label_id, x, y, longitude=0, latitude=0, px=0, py=0):
+        if self.free_rows:
+            row = self.free_rows.pop()
+        else:
+            if self.size == len(self.alive):
+                self.grow()
+            row, self.size = self.size, self.size + 1
+        values = (id, label_id, x, y, longitude, latitude, px, py, 0, False)
+        for (name, _), value in zip(self.columns, values):
+            getattr(self, name)[row] = value
+        self.alive[row] = True
+        self.id_to_row[id] = row
+        self.index.update(row)
+        return PSF_Object(self, row)
+        
+    def extend(self, ids, x, y, longitude, latitude, px, py):
+        # vectorized add, for a batch of nodes without labels: returns their rows
+        count = len(ids)
+        reused = min(count, len(self.free_rows))
+        rows = self.free_rows[len(self.free_rows) - reused:]
+        del self.free_rows[len(self.free_rows) - reused:]
+        while self.size + count - reused > len(self.alive):
+            self.grow()
+        rows = np.concatenate((
+                               np.array(rows, dtype=np.int64), 
+                               np.arange(self.size, self.size + count - reused)
+                               ))
+        self.size += count - reused
+        values = (ids, 0, x, y, longitude, latitude, px, py, 0, False)
+        for (name, _), value in zip(self.columns, values):
+            getattr(self, name)[rows] = value
+        self.alive[rows] = True
+        self.id_to_row.update(zip(ids, rows.tolist()))
+        self.index.update(rows)
+        return rows
+        
+    def rows(self, nodes=None):
+        # rows of the given nodes (by default, all nodes) as an array
+        if nodes is None:
+            return self.alive[:self.size].nonzero()[0]
+        return np.fromiter((node.row for node in nodes), dtype=np.int64)
         
-    def __init__(self, id, label_id, x, y):
-        self.id = id
-        self.label_id = label_id
-        self.x, self.y = x, y
-        self.longitude, self.latitude = 0, 0
+    def pop(self, id):
+        row = self.id_to_row.pop(id)
+        self.alive[row] = False
+        self.free_rows.append(row)
+        return PSF_Object(self, row)
         
-class Map(tk.Canvas):
+    def clear(self):
+        self.__init__()
+        
+    def __getitem__(self, id):
+        return PSF_Object(self, self.id_to_row[id])
+        
+    def __contains__(self, id):
+        return id in self.id_to_row
+        
+    def __iter__(self):
+        return iter(self.id_to_row)
+        
+    def __len__(self):
+        return len(self.id_to_row)
+        
+    def keys(self):
+        return self.id_to_row.keys()
+        
+    def values(self):
+        return (PSF_Object(self, row) for row in self.id_to_row.values())
+        
+    def items(self):
+        return ((id, PSF_Object(self, row)) for id, row in self.id_to_row.items())
+        
+class NodeIndex():
+    
+    # Grid index of the projected coordinates of the nodes: the rows are 
+    # sorted by grid cell, and the rows of a column of cells are found with a 
+    # binary search. Nodes that are created or moved after the grid was built 
+    # are pending: they are tested one by one, until there are enough of them
+    # for the grid to be rebuilt. Deleted nodes are filtered out of the results.
+    
+    # average number of nodes per cell
+    density = 4
+    
+    # minimum number of pending rows before the grid is rebuilt
+    min_pending = 1024
+    
+    def __init__(self, store):
+        self.store = store
+        self.invalidate()
+        
+    def invalidate(self):
+        # the grid is rebuilt at the next query
+        self.keys = self.rows = None
+        self.moved = np.zeros(0, dtype=bool)
+        self.pending, self.pending_count = [], 0
+        
+    def update(self, rows):
+        # rows of the nodes that were created or moved
+        if self.keys is None:
+            return
+        rows = np.atleast_1d(rows)
+        if len(self.moved) < len(self.store.alive):
+            moved = np.zeros(len(self.store.alive), dtype=bool)
+            moved[:len(self.moved)] = self.moved
+            self.moved = moved
+        self.moved[rows] = True
+        self.pending.append(rows)
+        self.pending_count += len(rows)
+        if self.pending_count > max(self.min_pending, len(self.rows)//20):
+            self.invalidate()
+        
+    def build(self):
+        store = self.store
+        rows = store.rows()
+        px, py = store.px[rows], store.py[rows]
+        # nodes that cannot be projected (e.g the hidden side of the globe 
+        # with the orthographic projection) are not indexed
+        finite = np.isfinite(px) & np.isfinite(py)
+        rows, px, py = rows[finite], px[finite], py[finite]
+        self.cell, self.origin, self.shape = 1., (0., 0.), (1, 1)
+        if len(rows):
+            width, height = np.ptp(px), np.ptp(py)
+            # the cells are as large as needed to hold a few nodes each
+            self.cell = max(
+                            np.sqrt(width*height*self.density/len(rows)), 
+                            max(width, height)*self.density/len(rows), 
+                            1e-9
+                            )
+            self.origin = px.min(), py.min()
+            self.shape = (
+                          int(width//self.cell) + 1, 
+                          int(height//self.cell) + 1
+                          )
+        cx, cy = self.cells(px, py)
+        keys = cx*self.shape[1] + cy
+        order = np.argsort(keys, kind='stable')
+        self.keys, self.rows = keys[order], rows[order]
+        
+    def cells(self, px, py):
+        # grid cell of projected coordinates, clipped to the grid
+        return (
+                np.clip((px - self.origin[0])//self.cell, 0, self.shape[0] - 1)
+                                                                .astype(np.int64),
+                np.clip((py - self.origin[1])//self.cell, 0, self.shape[1] - 1)
+                                                                .astype(np.int64)
+                )
+        
+    def query(self, x0, y0, x1, y1):
+        # rows of the nodes whose projected coordinates are in a rectangle
+        if self.keys is None:
+            self.build()
+        store = self.store
+        x0, x1 = sorted((x0, x1))
+        y0, y1 = sorted((y0, y1))
+        (cx0, cx1), (cy0, cy1) = self.cells(np.array((x0, x1)), np.array((y0, y1)))
+        # the cells of a column of the grid are contiguous in the sorted keys
+        columns = np.arange(cx0, cx1 + 1)*self.shape[1]
+        start = np.searchsorted(self.keys, columns + cy0)
+        end = np.searchsorted(self.keys, columns + cy1, side='right')
+        sizes = end - start
+        offsets = np.concatenate(([0], np.cumsum(sizes)))
+        indices = (np.arange(offsets[-1]) 
+                    + np.repeat(start - offsets[:-1], sizes))
+        rows = self.rows[indices]
+        if self.pending:
+            # the grid position of the pending rows may be outdated
+            rows = np.concatenate((
+                                   rows[~self.moved[rows]], 
+                                   np.unique(np.concatenate(self.pending))
+                                   ))
+        rows = rows[store.alive[rows]]
+        px, py = store.px[rows], store.py[rows]
+        return np.sort(rows[(x0 <= px) & (px <= x1) & (y0 <= py) & (py <= y1)])
+        
+    def nearest(self, x, y, radius):
+        # row of the closest node within a square of the given half size, 
+        # or None if there is no such node
+        rows = self.query(x - radius, y - radius, x + radius, y + radius)
+        if not len(rows):
+            return None
+        store = self.store
+        distances = (store.px[rows] - x)**2 + (store.py[rows] - y)**2
+        return int(rows[np.argmin(distances)])
+        
+class GeometryCache():
+    
+    # a projected layer is a tuple of three arrays: the projected vertices of 
+    # all rings (N x 2), the boundaries of each ring in the vertex array, and
+    # whether each ring is an exterior ring (land) or an interior ring (hole)
+    arrays = ('coords', 'bounds', 'exterior')
+    
+    def __init__(self, cache_dir=None, memory_budget=256*2**20):
+        self.cache_dir = cache_dir
+        self.memory_budget = memory_budget
+        self.layers = OrderedDict()
+        self.size = 0
+        # the cache is shared by the GUI and the reprojection thread
+        self.lock = threading.RLock()
+        
+    def key(self, filepath, projection):
+        # the key changes whenever the shapefile is modified
+        stat = os.stat(filepath)
+        return (abspath(filepath), stat.st_mtime_ns, stat.st_size, projection.srs)
+        
+    def get(self, filepath, projection, build, tolerance=0):
+        layer = self.lookup(filepath, projection, tolerance)
+        if layer is None:
+            layer = build()
+            self.store(filepath, projection, layer, tolerance)
+        return layer
+        
+    def lookup(self, filepath, projection, tolerance=0):
+        key = self.key(filepath, projection) + (tolerance,)
+        with self.lock:
+            if key in self.layers:
+                self.layers.move_to_end(key)
+                return self.layers[key]
+            layer = self.load(key)
+            if layer is not None:
+                self.add(key, layer)
+            return layer
+        
+    def store(self, filepath, projection, layer, tolerance=0, dump=True):
+        # layers computed by another process are already on the disk
+        key = self.key(filepath, projection) + (tolerance,)
+        with self.lock:
+            if dump:
+                self.dump(key, layer)
+            self.add(key, layer)
+        
+    def add(self, key, layer):
+        self.layers[key] = layer
+        self.size += sum(array.nbytes for array in layer)
+        # least recently used layers are evicted until the cache fits in its 
+        # memory budget (the layer that was just added is always kept)
+        while self.size > self.memory_budget and len(self.layers) > 1:
+            _, evicted = self.layers.popitem(last=False)
+            self.size -= sum(array.nbytes for array in evicted)
+            
+    def discard(self, filepath, projection):
+        # every level of detail of the shapefile is dropped from the memory,
+        # including the ones of older versions of the file: they stay on the 
+        # disk
+        with self.lock:
+            for key in [key for key in self.layers if key[0] == abspath(filepath)
+                                                and key[3] == projection.srs]:
+                self.size -= sum(array.nbytes for array in self.layers.pop(key))
+            
+    def clear(self):
+        with self.lock:
+            self.layers.clear()
+            self.size = 0
+        
+    def name(self, key):
+        # the files of a layer are named after the hashes of the shapefile 
+        # path, of its version (modification time and size), and of the 
+        # projection and tolerance: older versions can be found and removed
+        filepath, mtime, size, *others = key
+        return '.'.join(sha1(repr(value).encode()).hexdigest()[:16] 
+                                for value in (filepath, (mtime, size), others))
+        
+    def paths(self, key):
+        return [join(self.cache_dir, '{}.{}.npy'.format(self.name(key), array)) 
+                                                    for array in self.arrays]
+                                                    
+    def prune(self, key):
+        # the files of the other versions of the shapefile are removed, so 
+        # that editing a shapefile does not leave its old layers on the disk
+        path, version, _ = self.name(key).split('.')
+        for name in os.listdir(self.cache_dir):
+            parts = name.split('.')
+            if len(parts) == 5 and parts[0] == path and parts[1] != version:
+                try:
+                    os.remove(join(self.cache_dir, name))
+                except OSError:
+                    pass
+        
+    def load(self, key):
+        if not self.cache_dir:
+            return None
+        try:
+            # the arrays are memory-mapped: only the pages that are actually
+            # read are loaded from the disk
+            return tuple(np.load(path, mmap_mode='r') for path in self.paths(key))
+        except (OSError, ValueError):
+            return None
+            
+    def dump(self, key, layer):
+        if not self.cache_dir:
+            return
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            self.prune(key)
+            for path, array in zip(self.paths(key), layer):
+                # write to a temporary file first, so that an interrupted 
+                # write never leaves a truncated array in the cache. The name
+                # is unique: the same key can be written at the same time by 
+                # the GUI, the reprojection thread and the layer pool.
+                fd, temp = tempfile.mkstemp(suffix='.tmp', dir=self.cache_dir)
+                try:
+                    with os.fdopen(fd, 'wb') as file:
+                        np.save(file, array)
+                    os.replace(temp, path)
+                finally:
+                    if os.path.exists(temp):
+                        os.remove(temp)
+        except OSError:
+            warnings.warn('the geometry cache could not be written to the disk')
+        
+class ShpReader():
+    
+    # Reader of the geometry of a shapefile: the .shp file is memory-mapped,
+    # and the part offsets and points of each shape are NumPy views of the 
+    # file: they are not copied until they are projected. Shapes are read as 
+    # (points (N x 2), part offsets) pairs. Shape types other than polygons 
+    # and polylines (e.g points, multipatches) are read with pyshp.
     
-    projections = {
-    'Mercator': pyproj.Proj(init="epsg:3395"),
-    'Azimuthal orthographic': pyproj.Proj('+proj=ortho +lon_0=28 +lat_0=47')
+    # polylines and polygons, with or without Z and M values: the X and Y 
+    # coordinates come first, in the same layout for all of them
+    shape_types = (3, 5, 13, 15, 23, 25)
+    
+    def __init__(self, filepath, native=True):
+        self.filepath = filepath
+        self.shp = np.memmap(filepath, dtype=np.uint8, mode='r')
+        self.size = len(self.shp)
+        # the header is 100 bytes long, and starts with the file code 9994
+        if self.size < 100 or struct.unpack_from('>i', self.shp)[0] != 9994:
+            raise shapefile.ShapefileException('not a shapefile (invalid header)')
+        self.shape_type ,= struct.unpack_from('<i', self.shp, 32)
+        self.bbox = struct.unpack_from('<4d', self.shp, 36)
+        self.native = native and self.shape_type in self.shape_types
+        self.sf, self.position = None, 100
+        if not self.native:
+            self.shp = None
+            self.sf = shapefile.Reader(filepath)
+            
+    def offsets(self):
+        # offset (in bytes) of each record: the index file (.shx) is used 
+        # when it exists, otherwise the record headers are read one by one
+        shx = os.path.splitext(self.filepath)[0] + '.shx'
+        if os.path.exists(shx):
+            index = np.fromfile(shx, dtype='>i4', offset=100).reshape(-1, 2)
+            return (2*index[:, 0]).tolist()
+        offsets, offset = [], 100
+        while offset + 8 <= self.size:
+            offsets.append(offset)
+            length ,= struct.unpack_from('>i', self.shp, offset + 4)
+            if length < 2:
+                raise shapefile.ShapefileException(
+                            'invalid record length at offset {}'.format(offset))
+            offset += 8 + 2*length
+        return offsets
+        
+    def __iter__(self):
+        if not self.native:
+            for shape in self.sf.iterShapes():
+                yield np.asarray(shape.points, dtype=float).reshape(-1, 2), shape.parts
+            return
+        for offset in self.offsets():
+            # content of a record: shape type, bounding box, number of parts 
+            # and points, part offsets, then the points
+            self.position = offset
+            # the record must fit in the file before it is read, so that a 
+            # truncated file fails like it does with pyshp
+            if not 100 <= offset <= self.size - 12:
+                raise shapefile.ShapefileException(
+                                'truncated record at offset {}'.format(offset))
+            # null shapes have no content beyond their type
+            if not struct.unpack_from('<i', self.shp, offset + 8)[0]:
+                continue
+            if offset + 52 > self.size:
+                raise shapefile.ShapefileException(
+                                'truncated record at offset {}'.format(offset))
+            parts, points = struct.unpack_from('<2i', self.shp, offset + 44)
+            if (parts < 0 or points < 0 
+                        or offset + 52 + 4*parts + 16*points > self.size):
+                raise shapefile.ShapefileException(
+                                'truncated record at offset {}'.format(offset))
+            offset += 52
+            yield (
+                   np.ndarray((points, 2), '<f8', self.shp, offset + 4*parts),
+                   np.ndarray(parts, '<i4', self.shp, offset)
+                   )
+        self.position = self.size
+                   
+    def progress(self):
+        # fraction of the file that was read
+        if self.sf:
+            return self.sf.shp.tell()/max(self.size, 1)
+        return self.position/max(self.size, 1)
+        
+    def close(self):
+        # the memory map is released once the last view is deleted
+        if self.sf:
+            self.sf.close()
+        self.shp = self.sf = None
+        
+class Projections(Mapping):
+    
+    # projections of the map, built on first use: only their definition is
+    # needed to fill the projection list of the menu
+    
+    definitions = {
+    'Mercator': {'init': 'epsg:3395'},
+    'Azimuthal orthographic': {'projparams': '+proj=ortho +lon_0=28 +lat_0=47'}
     }
     
+    def __init__(self):
+        self.projections = {}
+        
+    def __getitem__(self, name):
+        if name not in self.projections:
+            self.projections[name] = pyproj.Proj(**self.definitions[name])
+        return self.projections[name]
+        
+    def __iter__(self):
+        return iter(self.definitions)
+        
+    def __len__(self):
+        return len(self.definitions)
+        
+class Layer():
+    
+    # a shapefile of the map, and its levels of detail in the current 
+    # projection with their spatial index: the levels are None while the
+    # layer is being read, or once it was evicted from the memory (hidden)
+    
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self.visible = True
+        self.levels = self.trees = None
+        # read and projected by the layer pool
+        self.future = None
+        # last time the layer was shown or hidden, for the eviction
+        self.used = time.perf_counter()
+        
+    def size(self):
+        if not self.levels:
+            return 0
+        return sum(array.nbytes for level in self.levels for array in level)
+        
+class MapGeometry():
+    
+    # geometry pipeline of the map, without the canvas: shapefiles are read,
+    # projected, sorted and simplified in levels of detail, and the rings
+    # are drawn with the create_* methods of the subclass (the tk canvas of
+    # the GUI, or an image for the rasterization and the headless renderers)
+    
+    projections = Projections()
+    
+    # timings of the hot paths, shown in the performance panel of the menu
+    stats = Instrumentation()
+    
+    # simplification tolerances (in projected units, i.e meters) of the levels
+    # of detail: a level is drawn as long as its tolerance is below 2 pixels
+    tolerances = (0, 250, 1000, 4000, 16000, 64000, 256000)
+    
+    def to_canvas_coordinates(self, longitude, latitude):
+        px, py = self.projections[self.proj](longitude, latitude)
+        return px*self.ratio + self.offset[0], -py*self.ratio + self.offset[1]
+        
+    def to_projected_coordinates(self, x, y):
+        return (x - self.offset[0])/self.ratio, (self.offset[1] - y)/self.ratio
+        
+    def to_geographical_coordinates(self, x, y):
+        px, py = self.to_projected_coordinates(x, y)
+        return self.projections[self.proj](px, py, inverse=True)
+                
+    def read_shapefile(self, filepath, projection=None):
+        with self.stats.measure('draw_map.read') as counts:
+            sf = ShpReader(filepath)
+            shapes = list(sf)
+            counts['shapes'] = len(shapes)
+        layer = self.sort_layer(*self.project_shapes(shapes, projection))
+        del shapes
+        sf.close()
+        return layer
+        
+    def project_shapes(self, shapes, projection=None):
+        # the vertices of every ring are gathered in a single array, so that
+        # the whole layer is projected with one vectorized pyproj call
+        arrays = [(points, parts) for points, parts in shapes if len(points)]
+        rings, start = [], 0
+        for points, parts in arrays:
+            bounds = [start + i for i in parts] + [start + len(points)]
+            # each ring is associated to the area of its shape's bounding box
+            area = np.prod(np.ptp(points, axis=0))
+            rings.extend((i, j, area) for i, j in zip(bounds, bounds[1:]))
+            start = bounds[-1]
+        coords, bounds, exterior, areas = [np.empty((0, 2))], [0], [], []
+        if arrays:
+            longitudes, latitudes = np.concatenate([a[0] for a in arrays]).T
+            if projection is None:
+                projection = self.projections[self.proj]
+            with self.stats.measure('draw_map.projection') as counts:
+                px, py = projection(longitudes, latitudes)
+                counts['vertices'] = len(px)
+        conversion = time.perf_counter()
+        for i, j, area in rings:
+            lon, lat = longitudes[i:j], latitudes[i:j]
+            ring = np.column_stack((px[i:j], py[i:j]))
+            # vertices that cannot be projected (e.g the hidden side of the 
+            # globe with the orthographic projection) are dropped
+            ring = ring[np.isfinite(ring).all(axis=1)]
+            if len(ring) > 2:
+                coords.append(ring)
+                bounds.append(bounds[-1] + len(ring))
+                # exterior rings are clockwise, interior rings (holes) are
+                # counterclockwise: the sign of the shoelace area tells them apart
+                exterior.append(np.dot(lon[:-1], lat[1:]) <= np.dot(lon[1:], lat[:-1]))
+                areas.append(area)
+        self.stats.record('draw_map.conversion', time.perf_counter() - conversion,
+                                                            rings=len(exterior))
+        return (
+                np.concatenate(coords), 
+                np.array(bounds), 
+                np.array(exterior, dtype=bool), 
+                np.array(areas)
+                )
+                
+    def merge_layers(self, layers):
+        # the arrays that follow the vertices and the ring boundaries (e.g 
+        # exterior, areas) have one value per ring
+        coords, bounds, *others = zip(*layers)
+        offsets = np.cumsum([0] + [b[-1] for b in bounds])
+        return (
+                np.concatenate(coords),
+                np.concatenate([[0]] + [b[1:] + o for b, o in zip(bounds, offsets)]),
+                *(np.concatenate(arrays) for arrays in others)
+                )
+                
+    def sort_layer(self, coords, bounds, exterior, areas):
+        # large shapes are drawn first: enclaves (e.g Lesotho) must come after 
+        # the shape they are enclosed in, whose hole is filled with water
+        order = np.argsort(-areas, kind='stable')
+        sizes = np.diff(bounds)[order]
+        new_bounds = np.concatenate(([0], np.cumsum(sizes)))
+        vertices = (np.arange(new_bounds[-1]) 
+                    + np.repeat(bounds[:-1][order] - new_bounds[:-1], sizes))
+        return coords[vertices], new_bounds, exterior[order]
+        
+    def simplify_layer(self, layer, tolerance):
+        coords, bounds, exterior = layer
+        if len(bounds) == 1:
+            return layer
+        # vertices are snapped to a grid whose cells are as large as the 
+        # tolerance: consecutive vertices that fall in the same cell are merged
+        cells = np.floor(coords/tolerance)
+        keep = np.ones(len(coords), dtype=bool)
+        keep[1:] = (cells[1:] != cells[:-1]).any(axis=1)
+        keep[bounds[:-1]] = True
+        # rings that are reduced to less than 3 vertices are smaller than a 
+        # pixel at this level of detail: they are removed
+        counts = np.add.reduceat(keep.astype(int), bounds[:-1])
+        valid = counts > 2
+        keep &= np.repeat(valid, np.diff(bounds))
+        new_bounds = np.concatenate(([0], np.cumsum(counts[valid])))
+        return coords[keep], new_bounds, exterior[valid]
+        
+    @timed('draw_map.levels')
+    def compute_levels(self, filepath, projection, cancelled=lambda: False):
+        # levels of detail of a shapefile, or None if the computation was 
+        # cancelled (the reprojection thread checks between two levels 
+        # whether its result is still needed)
+        layer = self.cache.get(filepath, projection, 
+                            lambda: self.read_shapefile(filepath, projection))
+        levels = [layer]
+        for tolerance in self.tolerances[1:]:
+            if cancelled():
+                return None
+            levels.append(self.cache.get(
+                        filepath, 
+                        projection,
+                        lambda: self.simplify_layer(layer, tolerance),
+                        tolerance
+                        ))
+        return levels
+        
+    def ring_bounds(self, coords, bounds):
+        # lower left and upper right corners of the bounding box of each ring
+        if len(bounds) == 1:
+            return np.empty((0, 2)), np.empty((0, 2))
+        return (
+                np.minimum.reduceat(coords, bounds[:-1], axis=0),
+                np.maximum.reduceat(coords, bounds[:-1], axis=0)
+                )
+        
+    def ring_index(self, layer):
+        lower, upper = self.ring_bounds(*layer[:2])
+        return shapely.STRtree(shapely.box(*lower.T, *upper.T))
+            
+    def draw_water(self):
+        if self.proj == 'Mercator':
+            x0, y0 = self.to_canvas_coordinates(-180, 84)
+            x1, y1 = self.to_canvas_coordinates(180, -84)
+            self.water_id = self.create_rectangle(x1, y1, x0, y0,
+                        outline='black', fill='deep sky blue', tags=('water',))
+        else:
+            cx, cy = self.to_canvas_coordinates(28, 47)
+            R = 6378000*self.ratio
+            self.water_id = self.create_oval(cx - R, cy - R, cx + R, cy + R,
+                        outline='black', fill='deep sky blue', tags=('water',))
+        
+    def draw_ring(self, coords, bounds, exterior, ring):
+        i, j = bounds[ring], bounds[ring + 1]
+        return self.create_polygon(
+                    np.column_stack((
+                                     coords[i:j, 0]*self.ratio + self.offset[0],
+                                     -coords[i:j, 1]*self.ratio + self.offset[1]
+                                     )).ravel().tolist(),
+                    fill = 'green3' if exterior[ring] else 'deep sky blue', 
+                    outline = 'black', 
+                    tags = ('land',)
+                    )
+            
+class Map(tk.Canvas, MapGeometry):
+    
     size = 10
     
+    # ellipsoid used to compute geographical distances
+    @cached_property
+    def geod(self):
+        return pyproj.Geod(ellps='WGS84')
+    
+    # half the size of the node images, in pixels
+    node_size = 20
+    
+    # maximum duration (in seconds) of a shapefile streaming step, and 
+    # maximum number of vertices read in a step (the shapes are read faster
+    # than they are projected and drawn)
+    time_slice = 0.03
+    batch_vertices = 50000
+    
+    # delay (in milliseconds) after the last zoom, pan or drag event before
+    # the labels are updated
+    label_delay = 100
+    
+    # delay (in milliseconds) between two moves of the dragged nodes: the 
+    # motion events that occur in the meantime are coalesced
+    frame_delay = 16
+    
+    # number of rows of a node file that are read and projected at once
+    chunk_size = 1000
+    
+    # delay (in milliseconds) after the last zoom or pan event before the 
+    # base layer is rasterized again, in raster mode
+    raster_delay = 200
+    
+    # colors of the base layer, converted to RGB for the rasterization
+    raster_colors = ('white', 'black', 'green3', 'deep sky blue')
+    
+    # memory budget (in bytes) of the projected layers: beyond it, hidden
+    # layers are evicted, starting with the least recently used
+    layer_budget = 512*2**20
+    
     def __init__(self, controller):
         super().__init__(controller, bg='white', width=1300, height=800)
         self.controller = controller
-        self.node_id_to_node = {}
+        self.node_id_to_node = NodeStore()
         self.drag_item = None
         self.start_position = [None]*2
         self.start_pos_main_node = [None]*2
-        self.dict_start_position = {}
+        # rows and initial positions of the nodes being dragged, last position
+        # of the mouse, and offset of the group of dragged items on the canvas
+        self.drag_rows, self.drag_start_position = None, None
+        self.drag_position, self.drag_offset = None, (0, 0)
+        self.drag_job = None
         self.selected_nodes = set()
-        self.filepath = None
+        # layers of the map, in drawing order (the last one is on top)
+        self.layers = []
+        # the layers are read in parallel by a process pool, created on the
+        # first import, and polled with after()
+        self.layer_pool = self.layer_job = None
         self.proj = 'Mercator'
         self.ratio, self.offset = 1, (0, 0)
+        self.cache = GeometryCache(join(path_app, 'cache'))
+        # levels of detail of the visible layers, in drawing order, and the 
+        # spatial index of the rings' bounding boxes of each level: the 
+        # layers are drawn one after another, without a merged copy
+        self.levels, self.level = [], 0
+        self.trees = []
+        # rings of the current level that are drawn on the canvas: the sorted
+        # (layer index, ring index) keys, in drawing order, and the (key -> 
+        # item ID) dict
+        self.drawn_rings, self.ring_to_id = [], {}
+        # layer being streamed: (layer, reader, shape iterator, projected 
+        # batches, start time)
+        self.stream = self.stream_job = None
+        self.label_job = None
+        # node file being imported: (chunk iterator, start time, row counts)
+        self.node_import = self.node_job = None
+        # in raster mode, the base layer is drawn in an image by a worker
+        # thread. The image covers an area of the canvas (in canvas 
+        # coordinates), that is zoomed like the other items until the image 
+        # is rasterized again at the new ratio.
+        self.raster = False
+        self.raster_id = self.raster_image = self.raster_photo = None
+        self.raster_area, self.raster_ratio = None, None
+        self.raster_job = self.raster_future = None
+        self.raster_pool = ThreadPoolExecutor(max_workers=1)
+        # reprojection requested from the projection list: (request number,
+        # worker thread, future of the last request, polling job)
+        self.projection_request, self.projection_start = 0, None
+        self.projection_pool = ThreadPoolExecutor(max_workers=1)
+        self.projection_future = self.projection_job = None
+        # shapes of the map in geographical coordinates, for the spatial join:
+        # (shapefile key, spatial index, attribute fields and records)
+        self.regions = None
         self.bind('<MouseWheel>', self.zoomer)
         self.bind('<Button-4>', lambda e: self.zoomer(e, 1.3))
         self.bind('<Button-5>', lambda e: self.zoomer(e, 0.7))
         self.bind('<ButtonPress-3>', lambda e: self.scan_mark(e.x, e.y))
-        self.bind('<B3-Motion>', lambda e: self.scan_dragto(e.x, e.y, gain=1))
+        self.bind('<B3-Motion>', self.pan)
+        self.bind('<Configure>', lambda _: self.update_viewport())
         self.bind('<Enter>', self.drag_and_drop, add='+')
         self.bind('<ButtonPress-1>', self.start_point_select_objects, add='+')
         self.bind('<B1-Motion>', self.rectangle_drawing)
@@ -189,49 +1323,560 @@ class Map(tk.Canvas):
             function(self, event, *others)
         return wrapper
         
-    def to_canvas_coordinates(self, longitude, latitude):
-        px, py = self.projections[self.proj](longitude, latitude)
-        return px*self.ratio + self.offset[0], -py*self.ratio + self.offset[1]
-        
-    def to_geographical_coordinates(self, x, y):
-        px, py = (x - self.offset[0])/self.ratio, (self.offset[1] - y)/self.ratio
-        return self.projections[self.proj](px, py, inverse=True)
-                
     def import_map(self):
-        filepath = tk.filedialog.askopenfilenames(title='Import shapefile')
-        if not filepath: 
+        filepaths = tk.filedialog.askopenfilenames(title='Import shapefile')
+        if not filepaths: 
             return
-        else: 
-            self.filepath ,= filepath
-        self.draw_map()
+        self.add_layers(filepaths)
+        
+    def add_layers(self, filepaths):
+        # the shapefiles are overlaid on the current layers, if any
+        first = not self.layers
+        filepaths = [filepath for filepath in filepaths if filepath not in 
+                                    [layer.filepath for layer in self.layers]]
+        self.layers.extend(Layer(filepath) for filepath in filepaths)
+        if first:
+            self.draw_map()
+        else:
+            self.load_layers()
         
+    @timed('draw_map')
     def draw_map(self):
-        if not self.filepath:
+        if not self.layers:
             return
+        self.cancel_import()
+        self.cancel_layers()
+        self.delete_raster()
         self.delete('land', 'water')
+        self.levels, self.trees = [], []
+        self.drawn_rings, self.ring_to_id = [], {}
         self.ratio, self.offset = 1, (0, 0)
         self.draw_water()
-        sf = shapefile.Reader(self.filepath)       
-        polygons = sf.shapes() 
-        for polygon in polygons:
-            polygon = shapely.geometry.shape(polygon)
-            if polygon.geom_type == 'Polygon':
-                polygon = [polygon]
-            for land in polygon:
-                land = str(land)[10:-2].replace(', ', ',').replace(' ', ',')
-                coords = land.replace('(', '').replace(')', '').split(',')
-                self.create_polygon(
-                                    sum((self.to_canvas_coordinates(*c) 
-                                    for c in zip(coords[0::2], coords[1::2])), ()),    
-                                    fill = 'green3', 
-                                    outline = 'black', 
-                                    tags = ('land',)
-                                    )
         self.redraw_nodes()
+        for layer in self.layers:
+            layer.levels = layer.trees = None
+        self.load_layers()
+        
+    def load_layers(self):
+        # layers that were projected before are loaded from the cache, the
+        # others are read and projected: a single shapefile is streamed, so 
+        # that it is drawn progressively, and several shapefiles are read in 
+        # parallel in the layer pool, without freezing the GUI
+        projection = self.projections[self.proj]
+        streamed = self.stream[0] if self.stream else None
+        missing = []
+        for layer in self.layers:
+            if not layer.visible or layer.levels or layer.future or layer is streamed:
+                continue
+            if self.cache.lookup(layer.filepath, projection) is None:
+                missing.append(layer)
+            else:
+                self.build_levels(layer)
+        if len(missing) == 1 and not self.stream and not self.layer_job:
+            layer ,= missing
+            try:
+                sf = ShpReader(layer.filepath)
+            except (OSError, ValueError, shapefile.ShapefileException) as error:
+                self.drop_layer(layer, error)
+                return
+            self.stream = layer, sf, iter(sf), [], time.perf_counter()
+            self.stream_job = self.after_idle(self.stream_shapefile)
+        elif missing:
+            pool = self.get_layer_pool()
+            for layer in missing:
+                layer.future = pool.submit(load_layer, layer.filepath, 
+                                                self.proj, self.cache.cache_dir)
+            if not self.layer_job:
+                self.layer_job = self.after(20, self.poll_layers)
+        self.compose_layers()
+        
+    def get_layer_pool(self):
+        # the worker processes are started with spawn: unlike fork, it is safe 
+        # with the threads of the GUI (raster and reprojection)
+        if not self.layer_pool:
+            self.layer_pool = ProcessPoolExecutor(
+                            mp_context=multiprocessing.get_context('spawn'))
+        return self.layer_pool
+        
+    def poll_layers(self):
+        # the job has run: it is cleared first, so that an error cannot leave
+        # it set, which would prevent load_layers from polling again
+        self.layer_job = None
+        loading = [layer for layer in self.layers if layer.future]
+        done = [layer for layer in loading if layer.future.done()]
+        for layer in done:
+            future, layer.future = layer.future, None
+            # a truncated or corrupt shapefile may fail with any error in the 
+            # worker process: the layer is dropped, the others are still drawn
+            try:
+                levels = future.result()
+            except Exception as error:
+                warnings.warn('{} could not be read: {}'.format(layer.filepath, error))
+                self.layers.remove(layer)
+                continue
+            self.cache_levels(layer.filepath, self.projections[self.proj], levels)
+            layer.levels = levels
+            layer.trees = [self.ring_index(level) for level in levels]
+        if len(done) < len(loading):
+            visible = [layer for layer in self.layers if layer.visible]
+            self.set_progress(sum(bool(layer.levels) for layer in visible)
+                                                        /max(len(visible), 1))
+            self.layer_job = self.after(20, self.poll_layers)
+        else:
+            self.set_progress(0)
+        if done:
+            self.compose_layers()
+            self.evict_layers()
+            
+    def cache_levels(self, filepath, projection, levels):
+        # levels read by the layer pool are added to the cache in memory
+        for level, tolerance in zip(levels, self.tolerances):
+            self.cache.store(filepath, projection, level, tolerance, dump=False)
+            
+    def cancel_layers(self):
+        # the layers that are being read are dropped: the processes cannot be
+        # interrupted, but their results are ignored
+        for layer in self.layers:
+            if layer.future:
+                layer.future.cancel()
+            layer.future = None
+        if self.layer_job:
+            self.after_cancel(self.layer_job)
+        self.layer_job = None
+        
+    def compose_layers(self):
+        # the visible layers are drawn in order: the rings of the top layer 
+        # come last, and are drawn above the others
+        visible = [layer for layer in self.layers if layer.visible and layer.levels]
+        self.levels = [layer.levels for layer in visible]
+        self.trees = [layer.trees for layer in visible]
+        if self.levels:
+            # in raster mode, the image is drawn again with the new layers
+            self.raster_ratio = None
+            self.draw_land()
+        else:
+            self.delete_raster()
+            self.delete('land')
+            self.drawn_rings, self.ring_to_id = [], {}
+        self.controller.menu.show_layers(self.layers)
+        
+    def evict_layers(self):
+        # hidden layers are dropped from the memory, least recently used 
+        # first, until the layers fit in the budget: they are loaded again 
+        # (from the cache on the disk, if possible) once they are shown. The
+        # arrays are also dropped from the cache in memory, which would 
+        # otherwise keep them alive.
+        size = sum(layer.size() for layer in self.layers)
+        hidden = [layer for layer in self.layers 
+                                    if not layer.visible and layer.levels]
+        for layer in sorted(hidden, key=lambda layer: layer.used):
+            if size <= self.layer_budget:
+                break
+            size -= layer.size()
+            layer.levels = layer.trees = None
+            self.cache.discard(layer.filepath, self.projections[self.proj])
+            
+    def toggle_layer(self, index):
+        layer = self.layers[index]
+        layer.visible, layer.used = not layer.visible, time.perf_counter()
+        if layer.visible and not layer.levels:
+            self.load_layers()
+        else:
+            self.compose_layers()
+        self.evict_layers()
+        
+    def move_layer(self, index, step):
+        # the layer is moved up (step 1) or down (step -1) in the drawing order
+        new_index = min(max(index + step, 0), len(self.layers) - 1)
+        self.layers.insert(new_index, self.layers.pop(index))
+        self.compose_layers()
+        return new_index
+        
+    def remove_layer(self, index):
+        layer = self.layers.pop(index)
+        if self.stream and self.stream[0] is layer:
+            self.cancel_import()
+        if layer.future:
+            layer.future.cancel()
+        if not self.layers:
+            self.delete_map()
+        else:
+            self.compose_layers()
+        
+    def drop_layer(self, layer, error):
+        # a shapefile that cannot be read is reported, and removed from the map
+        warnings.warn('{} could not be read: {}'.format(layer.filepath, error))
+        self.remove_layer(self.layers.index(layer))
+        
+    def top_layer(self):
+        # shapefile of the top visible layer, used for the spatial join
+        visible = [layer.filepath for layer in self.layers if layer.visible]
+        return visible[-1] if visible else None
+            
+    def stream_shapefile(self):
+        layer, sf, shapes, batches, stream_start = self.stream
+        # shapes are read until the time slice is over, then the batch is 
+        # projected and drawn, and the next batch is scheduled with after()
+        start, batch, vertices, done = time.perf_counter(), [], 0, True
+        try:
+            for shape in shapes:
+                batch.append(shape)
+                vertices += len(shape[0])
+                if (time.perf_counter() - start > self.time_slice 
+                                            or vertices > self.batch_vertices):
+                    done = False
+                    break
+        except (OSError, ValueError, shapefile.ShapefileException) as error:
+            # the shapes drawn so far are deleted with the layer
+            self.drop_layer(layer, error)
+            # other layers may have been shown while the layer was streamed
+            self.load_layers()
+            return
+        self.stats.record('draw_map.read', time.perf_counter() - start, 
+                                                            shapes=len(batch))
+        batches.append(self.project_shapes(batch))
+        coords, bounds, exterior, _ = batches[-1]
+        lower, upper = self.ring_bounds(coords, bounds)
+        x0, y0, x1, y1 = self.viewport()
+        visible = ((lower[:, 0] < x1) & (upper[:, 0] > x0) 
+                    & (lower[:, 1] < y1) & (upper[:, 1] > y0)).nonzero()[0]
+        with self.stats.measure('draw_map.items') as counts:
+            for ring in visible:
+                self.draw_ring(coords, bounds, exterior, ring)
+            counts['items'] = len(visible)
+        self.tag_lower('land')
+        self.tag_lower('water')
+        self.set_progress(sf.progress())
+        if not done:
+            self.stream_job = self.after(1, self.stream_shapefile)
+            return
+        # the whole shapefile was read: the projected layer is stored in the
+        # cache, and replaced with its levels of detail
+        self.cancel_import()
+        self.cache.store(
+                         layer.filepath, 
+                         self.projections[self.proj], 
+                         self.sort_layer(*self.merge_layers(batches))
+                         )
+        self.build_levels(layer)
+        self.compose_layers()
+        self.evict_layers()
+        # other layers may have been shown while the layer was streamed
+        self.load_layers()
+        # duration of the whole import, from the first batch to the last one
+        self.stats.record('draw_map.stream', time.perf_counter() - stream_start)
+        
+    def cancel_import(self):
+        # a new import, a projection change or the deletion of the map stops
+        # the shapefile that is being streamed, if any
+        if self.stream_job:
+            self.after_cancel(self.stream_job)
+            self.stream[1].close()
+        self.stream = self.stream_job = None
+        self.set_progress(0)
+        
+    def set_progress(self, fraction):
+        self.controller.menu.progress_bar['value'] = 100*fraction
+        
+    def build_levels(self, layer):
+        layer.levels = self.compute_levels(layer.filepath, self.projections[self.proj])
+        layer.trees = [self.ring_index(level) for level in layer.levels]
+        
+    def level_of_detail(self):
+        pixel_size = 1/self.ratio
+        return max(level for level, tolerance in enumerate(self.tolerances) 
+                                                    if tolerance <= 2*pixel_size)
+        
+    def draw_land(self):
+        self.level = self.level_of_detail()
+        # in raster mode, the polygons (if any) are kept until the image 
+        # that replaces them is ready
+        if self.raster:
+            self.schedule_raster()
+            return
+        self.delete('land')
+        self.drawn_rings, self.ring_to_id = [], {}
+        self.update_viewport()
+        
+    def visible_area(self, margin=0):
+        # visible area of the canvas (in canvas coordinates), extended on
+        # each side by a margin (in proportion of the canvas size)
+        width, height = self.winfo_width(), self.winfo_height()
+        return (
+                self.canvasx(-margin*width), 
+                self.canvasy(-margin*height),
+                self.canvasx((1 + margin)*width), 
+                self.canvasy((1 + margin)*height)
+                )
+        
+    def viewport(self):
+        # the visible area is extended by half its size on each side, so
+        # that small pans do not require to draw new polygons
+        x0, y0, x1, y1 = self.visible_area(0.5)
+        # the area is converted to projected coordinates, like the rings
+        return (
+                (x0 - self.offset[0])/self.ratio, 
+                (self.offset[1] - y1)/self.ratio,
+                (x1 - self.offset[0])/self.ratio, 
+                (self.offset[1] - y0)/self.ratio
+                )
+        
+    def update_viewport(self):
+        if not self.levels:
+            return
+        if self.raster:
+            self.schedule_raster()
+            return
+        with self.stats.measure('draw_map.items') as counts:
+            self.draw_visible_rings(counts)
+            
+    def draw_visible_rings(self, counts):
+        viewport = shapely.box(*self.viewport())
+        visible = {(index, ring) for index, trees in enumerate(self.trees) 
+                        for ring in trees[self.level].query(viewport).tolist()}
+        for key in self.ring_to_id.keys() - visible:
+            self.delete(self.ring_to_id.pop(key))
+            self.drawn_rings.remove(key)
+        new_rings = sorted(visible - self.ring_to_id.keys())
+        counts['items'] = len(new_rings)
+        for key in new_rings:
+            index, ring = key
+            id = self.draw_ring(*self.levels[index][self.level], ring)
+            # the polygon is inserted in the display list according to its 
+            # layer and ring indices, so that the layers, holes and enclaves 
+            # are drawn in the right order, and the land stays below the 
+            # nodes, and above the water
+            position = bisect(self.drawn_rings, key)
+            if position:
+                self.tag_raise(id, self.ring_to_id[self.drawn_rings[position - 1]])
+            elif self.drawn_rings:
+                self.tag_lower(id, self.ring_to_id[self.drawn_rings[0]])
+            else:
+                self.tag_lower(id)
+                self.tag_lower('water')
+            insort(self.drawn_rings, key)
+            self.ring_to_id[key] = id
+            
+    def set_raster_mode(self, raster):
+        self.raster = raster
+        self.delete_raster()
+        if self.levels:
+            self.draw_land()
+            
+    def delete_raster(self):
+        if self.raster_job:
+            self.after_cancel(self.raster_job)
+        if self.raster_future:
+            self.raster_future.cancel()
+        self.delete('raster')
+        self.raster_id = self.raster_image = self.raster_photo = None
+        self.raster_area = self.raster_ratio = None
+        self.raster_job = self.raster_future = None
+        
+    def schedule_raster(self):
+        # the base layer is rasterized once the zoom or pan is over
+        if self.raster_job:
+            self.after_cancel(self.raster_job)
+        self.raster_job = self.after(self.raster_delay, self.start_raster)
+        
+    def start_raster(self):
+        self.raster_job = None
+        if not self.levels:
+            return
+        area = tuple(round(value) for value in self.visible_area(0.5))
+        # the image is not rasterized again if it is at the current ratio, 
+        # and still covers the visible area
+        if self.raster_ratio == self.ratio:
+            x0, y0, x1, y1 = self.raster_area
+            v0, w0, v1, w1 = self.visible_area()
+            if x0 <= v0 and y0 <= w0 and v1 <= x1 and w1 <= y1:
+                return
+        if self.raster_future:
+            self.raster_future.cancel()
+        colors = {color: tuple(value >> 8 for value in self.winfo_rgb(color))
+                                                for color in self.raster_colors}
+        water = 'rectangle' if self.proj == 'Mercator' else 'oval'
+        self.raster_future = self.raster_pool.submit(
+                                    self.rasterize,
+                                    [levels[self.level] for levels in self.levels],
+                                    [trees[self.level] for trees in self.trees],
+                                    self.ratio,
+                                    self.offset,
+                                    area,
+                                    (water, self.coords(self.water_id)),
+                                    colors
+                                    )
+        self.raster_view = self.ratio, self.offset
+        self.raster_job = self.after(20, self.poll_raster)
+        
+    def rasterize(self, layers, trees, ratio, offset, area, water, colors):
+        # runs in the worker thread: it must not use the canvas
+        x0, y0, x1, y1 = area
+        image = ImageCanvas(ratio, (offset[0] - x0, offset[1] - y0), 
+                                                    (x1 - x0, y1 - y0), colors)
+        shape, coords = water
+        getattr(image, 'create_' + shape)(
+                                          *np.subtract(coords, (x0, y0)*2), 
+                                          fill = 'deep sky blue', 
+                                          outline = 'black'
+                                          )
+        # the rings that intersect the area are drawn in the order of the 
+        # layers, and of the rings in each layer
+        box = shapely.box(
+                          (x0 - offset[0])/ratio, 
+                          (offset[1] - y1)/ratio, 
+                          (x1 - offset[0])/ratio, 
+                          (offset[1] - y0)/ratio
+                          )
+        for layer, tree in zip(layers, trees):
+            for ring in np.sort(tree.query(box)).tolist():
+                image.draw_ring(*layer, ring)
+        return image.image, area
+        
+    def poll_raster(self):
+        if not self.raster_future.done():
+            self.raster_job = self.after(20, self.poll_raster)
+            return
+        future, self.raster_job, self.raster_future = self.raster_future, None, None
+        # the image is dropped if the map was zoomed in the meantime: another 
+        # rasterization is already scheduled
+        if (self.ratio, self.offset) != self.raster_view:
+            return
+        self.raster_image, self.raster_area = future.result()
+        self.raster_ratio = self.ratio
+        self.show_raster(self.raster_image, *self.raster_area[:2])
+        # the image replaces the polygons
+        self.delete('land')
+        self.drawn_rings, self.ring_to_id = [], {}
+        
+    def show_raster(self, image, x, y):
+        # the photo image must be referenced, otherwise it is not displayed
+        self.raster_photo = ImageTk.PhotoImage(image)
+        if self.raster_id is None:
+            self.raster_id = self.create_image(x, y, image=self.raster_photo, 
+                                                anchor='nw', tags=('raster',))
+        else:
+            self.coords(self.raster_id, x, y)
+            self.itemconfig(self.raster_id, image=self.raster_photo, state='normal')
+        self.tag_lower(self.raster_id)
+        self.tag_lower('water')
+        
+    def scale_raster(self):
+        # until the base layer is rasterized again, the visible part of the 
+        # cached image is scaled to the current ratio
+        x0, y0, x1, y1 = self.raster_area
+        v0, w0, v1, w1 = self.visible_area()
+        v0, w0, v1, w1 = max(x0, v0), max(y0, w0), min(x1, v1), min(y1, w1)
+        if v1 - v0 < 1 or w1 - w0 < 1:
+            self.itemconfig(self.raster_id, state='hidden')
+            return
+        scale = (x1 - x0)/self.raster_image.width
+        image = self.raster_image.resize(
+                                    (round(v1 - v0), round(w1 - w0)), 
+                                    Image.NEAREST,
+                                    box = ((v0 - x0)/scale, (w0 - y0)/scale, 
+                                            (v1 - x0)/scale, (w1 - y0)/scale)
+                                    )
+        self.show_raster(image, v0, w0)
+            
+    def pan(self, event):
+        self.scan_dragto(event.x, event.y, gain=1)
+        self.update_viewport()
+        self.schedule_labels()
         
     def delete_map(self):
+        self.cancel_import()
+        self.cancel_layers()
+        self.delete_raster()
         self.delete('land', 'water')
-        self.filepath = None
+        self.layers = []
+        self.levels, self.trees = [], []
+        self.drawn_rings, self.ring_to_id = [], {}
+        self.controller.menu.show_layers(self.layers)
+        
+    def read_regions(self, filepath):
+        # the shapes are indexed in geographical coordinates, like the nodes
+        sf = shapefile.Reader(filepath)
+        polygons = np.array([shapely.geometry.shape(shape.__geo_interface__) 
+                    if shape.points else None for shape in sf.iterShapes()], 
+                                                                    dtype=object)
+        # invalid polygons (e.g self-intersecting rings) are repaired, so 
+        # that the point-in-polygon tests do not fail
+        invalid = ~shapely.is_missing(polygons) & ~shapely.is_valid(polygons)
+        polygons[invalid] = shapely.make_valid(polygons[invalid])
+        shapely.prepare(polygons)
+        # the attributes are in the .dbf file, which is optional
+        try:
+            fields = [field[0] for field in sf.fields[1:]]
+            records = [list(record) for record in sf.iterRecords()]
+        except shapefile.ShapefileException:
+            fields, records = [], None
+        sf.close()
+        return shapely.STRtree(polygons), fields, records
+        
+    def spatial_join(self):
+        # the nodes are joined to the shapes of the top visible layer
+        filepath = self.top_layer()
+        if not filepath:
+            return
+        start = time.perf_counter()
+        key = self.cache.key(filepath, self.projections[self.proj])[:3]
+        if not self.regions or self.regions[0] != key:
+            self.regions = (key,) + self.read_regions(filepath)
+        tree = self.regions[1]
+        nodes = self.node_id_to_node
+        rows = nodes.rows()
+        nodes.region[rows] = 0
+        # all nodes are tested at once: the spatial index returns the pairs 
+        # (node, shape) such that the node is in the (prepared) shape
+        points = shapely.points(nodes.longitude[rows], nodes.latitude[rows])
+        node_index, shape_index = tree.query(points, predicate='intersects')
+        # a node on the border of several shapes is assigned to the first one:
+        # the pairs are sorted by node and shape, and the first pair of each 
+        # node is kept
+        order = np.lexsort((shape_index, node_index))
+        node_index, shape_index = node_index[order], shape_index[order]
+        node_index, first = np.unique(node_index, return_index=True)
+        nodes.region[rows[node_index]] = shape_index[first] + 1
+        self.controller.menu.join_status['text'] = (
+                '{} of {} nodes in {} shapes ({:.2f}s)'.format(
+                                int((nodes.region[rows] > 0).sum()), 
+                                len(rows),
+                                len(np.unique(shape_index)),
+                                time.perf_counter() - start
+                                ))
+        
+    def join_records(self):
+        # (node, shape index, attribute record) for each node: the shape index
+        # is None if the node is not in any shape, and the record is None if
+        # the shapefile has no attributes
+        records = self.regions[3] if self.regions else None
+        for node in self.node_id_to_node.values():
+            region = node.region - 1
+            if region < 0:
+                yield node, None, None
+            else:
+                yield node, region, records[region] if records else None
+                
+    def export_join(self):
+        filepath = filedialog.asksaveasfilename(
+                                                defaultextension = '.csv',
+                                                filetypes = (('csv files', '*.csv'),)
+                                                )
+        if not filepath:
+            return
+        self.save_join(filepath)
+        
+    def save_join(self, filepath):
+        fields = self.regions[2] if self.regions else []
+        with open(filepath, 'w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(['longitude', 'latitude', 'shape'] + fields)
+            for node, region, record in self.join_records():
+                if record is None:
+                    record = [''] * len(fields)
+                writer.writerow([node.longitude, node.latitude, 
+                                        '' if region is None else region] + record)
         
     def delete_selected_nodes(self):
         for node in self.selected_nodes:
@@ -239,31 +1884,160 @@ class Map(tk.Canvas):
             self.delete(node.id, node.label_id)
         self.selected_nodes.clear()
 
-    def draw_water(self):
-        if self.proj == 'Mercator':
-            x0, y0 = self.to_canvas_coordinates(-180, 84)
-            x1, y1 = self.to_canvas_coordinates(180, -84)
-            self.water_id = self.create_rectangle(x1, y1, x0, y0,
-                        outline='black', fill='deep sky blue', tags=('water',))
-        else:
-            cx, cy = self.to_canvas_coordinates(28, 47)
-            R = 6378000*self.ratio
-            self.water_id = self.create_oval(cx - R, cy - R, cx + R, cy + R,
-                        outline='black', fill='deep sky blue', tags=('water',))
-        
+    @timed('change_projection.request')
     def change_projection(self):
-        self.proj = self.controller.menu.projection_list.get()
-        self.draw_map()
+        self.request_projection(self.controller.menu.projection_list.get())
+        
+    def request_projection(self, proj):
+        # The map and the nodes are projected in a worker thread, while the
+        # current map remains usable: the new coordinates are swapped in at 
+        # once when they are ready. Only the last request is applied: the 
+        # previous ones are cancelled, or their result is dropped.
+        self.projection_request += 1
+        self.projection_start = time.perf_counter()
+        if self.projection_future:
+            self.projection_future.cancel()
+        nodes = self.node_id_to_node
+        rows = nodes.rows()
+        filepaths = [layer.filepath for layer in self.layers if layer.visible]
+        if filepaths:
+            self.get_layer_pool()
+        self.projection_future = self.projection_pool.submit(
+                                    self.project_map,
+                                    self.projection_request,
+                                    proj,
+                                    filepaths,
+                                    (rows, nodes.longitude[rows], nodes.latitude[rows])
+                                    )
+        if not self.projection_job:
+            self.projection_job = self.after(20, self.poll_projection)
+            
+    def project_map(self, request, proj, filepaths, nodes):
+        # runs in the worker thread, with its own copy of the projection
+        projection = pyproj.Proj(self.projections[proj].crs)
+        cancelled = lambda: request != self.projection_request
+        rows, longitudes, latitudes = nodes
+        px, py = projection(longitudes, latitudes)
+        # the visible layers that are not cached are read and projected in 
+        # parallel by the layer pool, the others are loaded from the cache. 
+        # A layer that cannot be read is replaced with the error, so that
+        # the GUI drops it, and the projection is still applied.
+        futures = {}
+        for filepath in filepaths:
+            try:
+                if self.cache.lookup(filepath, projection) is None:
+                    futures[filepath] = self.layer_pool.submit(load_layer, 
+                                        filepath, proj, self.cache.cache_dir)
+            except OSError:
+                continue
+        layers = []
+        for filepath in filepaths:
+            try:
+                if filepath in futures:
+                    levels = futures[filepath].result()
+                    self.cache_levels(filepath, projection, levels)
+                else:
+                    levels = self.compute_levels(filepath, projection, cancelled)
+            except Exception as error:
+                layers.append(error)
+                continue
+            if levels is None or cancelled():
+                for future in futures.values():
+                    future.cancel()
+                return None
+            layers.append((levels, [self.ring_index(level) for level in levels]))
+        return request, proj, filepaths, layers, (rows, longitudes, latitudes, px, py)
         
+    def poll_projection(self):
+        if not self.projection_future.done():
+            self.projection_job = self.after(20, self.poll_projection)
+            return
+        future, self.projection_job = self.projection_future, None
+        self.projection_future = None
+        result = future.result()
+        if not result or result[0] != self.projection_request:
+            return
+        _, proj, filepaths, layers, nodes = result
+        # layers were imported or shown in the meantime: they are projected 
+        # again
+        if filepaths != [layer.filepath for layer in self.layers if layer.visible]:
+            self.request_projection(proj)
+            return
+        self.swap_projection(proj, layers, nodes)
+        # latency of the projection change, from the request to the new map
+        self.stats.record('change_projection', 
+                                time.perf_counter() - self.projection_start)
+        
+    @timed('change_projection.swap')
+    def swap_projection(self, proj, layers, nodes):
+        self.proj = proj
+        redraw = bool(self.layers)
+        if redraw:
+            self.cancel_import()
+            self.cancel_layers()
+            self.delete_raster()
+            self.delete('land', 'water')
+            self.levels, self.trees = [], []
+            self.drawn_rings, self.ring_to_id = [], {}
+            # hidden layers are dropped: they are projected again once shown
+            visible = [layer for layer in self.layers if layer.visible]
+            for layer in self.layers:
+                layer.levels = layer.trees = None
+            for layer, result in zip(visible, layers):
+                if isinstance(result, Exception):
+                    warnings.warn('{} could not be read: {}'.format(
+                                                        layer.filepath, result))
+                    self.layers.remove(layer)
+                else:
+                    layer.levels, layer.trees = result
+            self.ratio, self.offset = 1, (0, 0)
+            self.draw_water()
+        rows, longitudes, latitudes, px, py = nodes
+        store = self.node_id_to_node
+        # nodes that were created or moved during the reprojection are 
+        # projected again, the others are updated with the new coordinates
+        valid = (store.alive[rows] & (store.longitude[rows] == longitudes) 
+                                        & (store.latitude[rows] == latitudes))
+        store.px[rows[valid]], store.py[rows[valid]] = px[valid], py[valid]
+        outdated = np.ones(len(store.alive), dtype=bool)
+        outdated[rows[valid]] = False
+        current = store.rows()
+        self.project_nodes(current[outdated[current]])
+        self.place_nodes(current)
+        if redraw:
+            self.compose_layers()
+        
+    @timed('redraw_nodes')
     def redraw_nodes(self):
-        for node_id, node in self.node_id_to_node.items():
-            cx, cy = self.to_canvas_coordinates(node.longitude, node.latitude)
-            node.x, node.y = cx, cy
-            self.coords(node_id, cx, cy)
-            self.update_node_label(node)
-            self.tag_raise(node_id)
-            self.tag_raise(node.label_id)
+        # all nodes are projected at once
+        rows = self.node_id_to_node.rows()
+        self.project_nodes(rows)
+        self.place_nodes(rows)
+        
+    def project_nodes(self, rows):
+        nodes = self.node_id_to_node
+        nodes.px[rows], nodes.py[rows] = self.projections[self.proj](
+                                    nodes.longitude[rows], nodes.latitude[rows])
+        
+    def place_nodes(self, rows):
+        # the canvas coordinates are computed from the projected coordinates
+        nodes = self.node_id_to_node
+        nodes.x[rows] = nodes.px[rows]*self.ratio + self.offset[0]
+        nodes.y[rows] = -nodes.py[rows]*self.ratio + self.offset[1]
+        # the projected coordinates changed: the spatial index is rebuilt
+        nodes.index.invalidate()
+        self.move_nodes(rows)
+        self.tag_raise('node')
+        self.schedule_labels()
+        
+    def move_nodes(self, rows):
+        # the nodes are moved to their position in the store
+        nodes = self.node_id_to_node
+        for id, x, y in zip(nodes.id[rows].tolist(), nodes.x[rows].tolist(), 
+                                                        nodes.y[rows].tolist()):
+            self.coords(id, x, y)
         
+    @timed('zoomer')
     @update_coordinates
     def zoomer(self, event, factor=None):
         if not factor: 
@@ -273,65 +2047,223 @@ class Map(tk.Canvas):
         self.ratio *= float(factor)
         self.offset = (self.offset[0]*factor + event.x*(1 - factor), 
                        self.offset[1]*factor + event.y*(1 - factor))
-        # we update all node's coordinates
-        for node_id, node in self.node_id_to_node.items():
-            node.x, node.y = self.coords(node_id)
-            self.update_node_label(node)
+        if self.raster_id:
+            x0, y0, x1, y1 = self.raster_area
+            self.raster_area = (x0*factor + event.x*(1 - factor), 
+                                y0*factor + event.y*(1 - factor),
+                                x1*factor + event.x*(1 - factor), 
+                                y1*factor + event.y*(1 - factor))
+            self.scale_raster()
+        # the land is redrawn when the zoom crosses a level of detail threshold
+        if self.levels and self.level_of_detail() != self.level:
+            self.draw_land()
+        else:
+            self.update_viewport()
+        # the canvas scaled the nodes: their new coordinates are computed for
+        # all nodes at once. Their geographical coordinates do not change, but
+        # the labels must be moved back under the nodes.
+        nodes = self.node_id_to_node
+        rows = nodes.rows()
+        nodes.x[rows] = nodes.x[rows]*factor + event.x*(1 - factor)
+        nodes.y[rows] = nodes.y[rows]*factor + event.y*(1 - factor)
+        self.schedule_labels()
             
-    def update_node_label(self, node):
-        node.longitude, node.latitude = self.to_geographical_coordinates(
-                                                                node.x, node.y)
-        label = '({:.5f}, {:.5f})'.format(node.longitude, node.latitude)
-        self.coords(node.label_id, node.x - 5, node.y + 30)
-        self.itemconfig(node.label_id, text=label)
-           
+    def label(self, longitude, latitude):
+        return '({:.5f}, {:.5f})'.format(longitude, latitude)
+        
+    def schedule_labels(self):
+        # the labels are updated once the zoom, pan or drag is over: events 
+        # that occur in the meantime postpone the update
+        if self.label_job:
+            self.after_cancel(self.label_job)
+        self.label_job = self.after(self.label_delay, self.update_labels)
+        
+    def update_labels(self):
+        self.label_job = None
+        # the labels of the dragged nodes are moved with them: the update is 
+        # postponed until the drop
+        if self.drag_rows is not None:
+            self.schedule_labels()
+            return
+        nodes = self.node_id_to_node
+        rows = nodes.rows()
+        x, y = nodes.x[rows], nodes.y[rows]
+        x0, y0, x1, y1 = self.visible_area()
+        visible = (x0 <= x) & (x <= x1) & (y0 <= y) & (y <= y1)
+        labelled = nodes.label_id[rows] > 0
+        # the labels of the nodes that are no longer visible are deleted
+        for row in rows[labelled & ~visible].tolist():
+            self.delete(int(nodes.label_id[row]))
+            nodes.label_id[row] = 0
+        # the labels that are still visible are moved back under their node,
+        # and their text is updated only if the node was moved
+        for row in rows[labelled & visible].tolist():
+            x, y = nodes.x[row], nodes.y[row]
+            self.coords(int(nodes.label_id[row]), x - 5, y + 30)
+            if nodes.stale[row]:
+                self.itemconfig(
+                                int(nodes.label_id[row]), 
+                                text = self.label(nodes.longitude[row], 
+                                                        nodes.latitude[row])
+                                )
+        nodes.stale[rows] = False
+        # a label is created for the nodes that became visible
+        self.create_labels(rows[~labelled & visible])
+        
+    def create_labels(self, rows):
+        # the labels are created until the time slice is over, and the next
+        # ones are scheduled with after(), so that a large import does not
+        # freeze the GUI: a zoom, pan or drag cancels the remaining ones
+        self.label_job = None
+        if self.drag_rows is not None:
+            self.schedule_labels()
+            return
+        nodes = self.node_id_to_node
+        start = time.perf_counter()
+        for index, row in enumerate(rows.tolist()):
+            if not nodes.alive[row] or nodes.label_id[row]:
+                continue
+            x, y = nodes.x[row], nodes.y[row]
+            selected = PSF_Object(nodes, row) in self.selected_nodes
+            nodes.label_id[row] = self.create_text(
+                                    x - 5, 
+                                    y + 30,
+                                    text = self.label(nodes.longitude[row], 
+                                                        nodes.latitude[row]),
+                                    tags = ('label', 'selected') if selected else ('label',)
+                                    )
+            if time.perf_counter() - start > self.time_slice:
+                self.label_job = self.after(1, self.create_labels, rows[index + 1:])
+                break
+        self.tag_raise('label')
+        
     @update_coordinates            
     def drag_and_drop(self, event):
-        if controller.drag_and_drop:
+        if self.controller.drag_and_drop:
             self.create_object(event.x, event.y)
-            controller.drag_and_drop = False
+            self.controller.drag_and_drop = False
                 
     def create_object(self, x, y):
         # create the node's image
         id = self.create_image(
                                x, 
                                y,
-                               image = controller.node_image,
+                               image = self.controller.node_image,
                                tags = ('node',)
                                )
-        # create the node's label
-        label_id = self.create_text(
-                                    x - 5, 
-                                    y + 30
-                                    )
-        # create the node object
-        node = PSF_Object(id, label_id, x, y)
-        # update the value of its label
-        self.update_node_label(node)
-        # store the node in the (node ID -> node) dictionnary
-        self.node_id_to_node[id] = node
+        px, py = self.to_projected_coordinates(x, y)
+        longitude, latitude = self.projections[self.proj](px, py, inverse=True)
+        # store the node in the node store: its label is created once all
+        # nodes are created, if it is visible
+        self.schedule_labels()
+        return self.node_id_to_node.add(id, 0, x, y, longitude, latitude, px, py)
+        
+    def node_at(self, x, y):
+        # node whose image is under a point of the canvas, if any
+        nodes = self.node_id_to_node
+        row = nodes.index.nearest(
+                                  *self.to_projected_coordinates(x, y), 
+                                  self.node_size/self.ratio
+                                  )
+        return None if row is None else PSF_Object(nodes, row)
+        
+    def nodes_in_area(self, x0, y0, x1, y1):
+        # nodes whose image is enclosed in a rectangle of the canvas
+        x0, x1 = sorted((x0, x1))
+        y0, y1 = sorted((y0, y1))
+        x0, y0, x1, y1 = (x0 + self.node_size, y0 + self.node_size, 
+                          x1 - self.node_size, y1 - self.node_size)
+        if x0 > x1 or y0 > y1:
+            return []
+        nodes = self.node_id_to_node
+        rows = nodes.index.query(*self.to_projected_coordinates(x0, y0), 
+                                        *self.to_projected_coordinates(x1, y1))
+        return [PSF_Object(nodes, row) for row in rows.tolist()]
+        
+    def nodes_within(self, longitude, latitude, distance):
+        # nodes at less than a given distance (in kilometers) of a point
+        nodes = self.node_id_to_node
+        azimuths = np.arange(0, 360, 5.)
+        boundary = self.geod.fwd(
+                                 np.full(len(azimuths), longitude), 
+                                 np.full(len(azimuths), latitude), 
+                                 azimuths, 
+                                 np.full(len(azimuths), 1000.*distance)
+                                 )[:2]
+        # the candidates are the nodes in the projected bounding box of the
+        # circle, unless it contains a pole (the bounding box of the boundary
+        # does not contain the pole), or the circle cannot be projected
+        poles = self.geod.inv((longitude,)*2, (latitude,)*2, (0, 0), (90, -90))[2]
+        rows = self.candidates(*boundary)
+        if rows is None or min(poles) <= 1000.*distance:
+            rows = nodes.rows()
+        distances = self.geod.inv(
+                                  np.full(len(rows), longitude), 
+                                  np.full(len(rows), latitude), 
+                                  nodes.longitude[rows], 
+                                  nodes.latitude[rows]
+                                  )[2]
+        return [PSF_Object(nodes, row) 
+                    for row in rows[distances <= 1000.*distance].tolist()]
+        
+    def nodes_in_polygon(self, polygon):
+        # nodes inside a polygon, given as a shapely polygon or a sequence
+        # of (longitude, latitude) points
+        if not isinstance(polygon, shapely.Geometry):
+            polygon = shapely.Polygon(polygon)
+        nodes = self.node_id_to_node
+        # the edges are split every degree, so that the projected bounding box
+        # of the vertices contains the projection of the edges
+        boundary = shapely.get_coordinates(shapely.segmentize(polygon.boundary, 1))
+        rows = self.candidates(*boundary.T)
+        if rows is None:
+            rows = nodes.rows()
+        shapely.prepare(polygon)
+        inside = shapely.contains_xy(polygon, nodes.longitude[rows], 
+                                                        nodes.latitude[rows])
+        return [PSF_Object(nodes, row) for row in rows[inside].tolist()]
+        
+    def candidates(self, longitudes, latitudes):
+        # rows of the nodes in the projected bounding box of a set of points, 
+        # or None if some of the points cannot be projected
+        px, py = self.projections[self.proj](longitudes, latitudes)
+        if not (np.isfinite(px).all() and np.isfinite(py).all()):
+            return None
+        # the bounding box is slightly extended to absorb rounding errors
+        margin = 1e-6*max(np.ptp(px), np.ptp(py), 1)
+        return self.node_id_to_node.index.query(px.min() - margin, py.min() - margin,
+                                                px.max() + margin, py.max() + margin)
                     
     @update_coordinates
     def find_closest_node(self, event):
-        self.dict_start_position.clear()
-        self.drag_item = self.find_closest(event.x, event.y)[0]
-        main_node_selected = self.node_id_to_node[self.drag_item]
+        main_node_selected = self.node_at(event.x, event.y)
+        if main_node_selected is None:
+            return
+        self.drag_item = main_node_selected.id
         self.start_pos_main_node = event.x, event.y
-        if main_node_selected in self.selected_nodes:
-            for sn in self.selected_nodes:
-                self.dict_start_position[sn] = [sn.x, sn.y]
-        else:
+        if main_node_selected not in self.selected_nodes:
             self.unselect_all()
-            self.dict_start_position[main_node_selected] = self.start_pos_main_node 
             self.select_objects(main_node_selected)
+        nodes = self.node_id_to_node
+        self.drag_rows = rows = nodes.rows(self.selected_nodes)
+        self.drag_start_position = np.column_stack((nodes.x[rows], nodes.y[rows]))
+        self.drag_position, self.drag_offset = (event.x, event.y), (0, 0)
+        # the selected nodes and their labels are tagged with a single canvas
+        # call: during the drag, they are moved as a group
+        self.dtag('drag')
+        self.addtag_withtag('drag', 'selected')
             
     def select_objects(self, *objects):
+        # the selected nodes and their labels have the 'selected' tag
         for obj in objects:
             self.selected_nodes.add(obj)
             self.itemconfig(
                             obj.id, 
                             image = self.controller.selected_node_image
                             )
+            self.addtag_withtag('selected', obj.id)
+            if obj.label_id:
+                self.addtag_withtag('selected', int(obj.label_id))
                 
     def unselect_objects(self, *objects):
         for obj in objects:
@@ -340,6 +2272,9 @@ class Map(tk.Canvas):
                             obj.id, 
                             image = self.controller.node_image
                             )
+            self.dtag(obj.id, 'selected')
+            if obj.label_id:
+                self.dtag(int(obj.label_id), 'selected')
                 
     def unselect_all(self):
         self.unselect_objects(*self.selected_nodes)
@@ -348,10 +2283,8 @@ class Map(tk.Canvas):
     def start_point_select_objects(self, event):
         # create the temporary line, only if there is nothing below
         # this is to avoid drawing a rectangle when moving a node
-        below = self.find_overlapping(event.x-1, event.y-1, event.x+1, event.y+1)
-        tags_below = ''.join(''.join(self.itemcget(id, 'tags')) for id in below)
-        # if no object is below the selection process can start
-        if 'node' not in tags_below:
+        # if no node is below the selection process can start
+        if self.node_at(event.x, event.y) is None:
             self.unselect_all()
             self.start_position = event.x, event.y
             self.temp_rectangle = self.create_rectangle(
@@ -372,52 +2305,179 @@ class Map(tk.Canvas):
     
     @update_coordinates
     def end_point_select_nodes(self, event):
+        if self.drag_rows is not None:
+            self.drop_nodes()
         if self.start_position != [None]*2:
             # delete the temporary lines
             self.delete(self.temp_rectangle)
             # select all nodes enclosed in the rectangle
             start_x, start_y = self.start_position
-            for obj in self.find_enclosed(start_x, start_y, event.x, event.y):
-                if obj in self.node_id_to_node:
-                    enclosed_obj = self.node_id_to_node[obj]
-                    self.select_objects(enclosed_obj)
+            self.select_objects(*self.nodes_in_area(start_x, start_y, 
+                                                            event.x, event.y))
             self.start_position = [None]*2
             
+    @timed('node_motion')
     @update_coordinates
     def node_motion(self, event):
-        node = self.node_id_to_node[self.drag_item]
-        for selected_node in self.selected_nodes:
-            # the main node initial position, the main node current position, 
-            # and the other node initial position form a rectangle.
-            # we find the position of the fourth vertix.
-            x0, y0 = self.start_pos_main_node
-            x1, y1 = self.dict_start_position[selected_node]
-            selected_node.x = x1 + (event.x - x0)
-            selected_node.y = y1 + (event.y - y0)
-            # move the node itself
-            self.coords(
-                        selected_node.id, 
-                        selected_node.x,
-                        selected_node.y
-                        )
-            # update the label
-            self.update_node_label(selected_node)
+        # the motion events are coalesced: the group of dragged items is 
+        # moved at most once per frame, to the last position of the mouse
+        if self.drag_rows is None:
+            return
+        self.drag_position = event.x, event.y
+        if not self.drag_job:
+            self.drag_job = self.after(self.frame_delay, self.move_group)
+            
+    @timed('node_motion.frame')
+    def move_group(self):
+        # the cost of a move does not depend on the number of dragged nodes:
+        # the store is only updated once the drag is over
+        self.drag_job = None
+        x0, y0 = self.start_pos_main_node
+        dx, dy = self.drag_position[0] - x0, self.drag_position[1] - y0
+        self.move('drag', dx - self.drag_offset[0], dy - self.drag_offset[1])
+        self.drag_offset = dx, dy
+        
+    @timed('node_motion.drop')
+    def drop_nodes(self):
+        # the last motion event is applied, then the positions and the 
+        # geographical coordinates of all dragged nodes are updated at once
+        if self.drag_job:
+            self.after_cancel(self.drag_job)
+            self.move_group()
+        nodes, rows = self.node_id_to_node, self.drag_rows
+        nodes.x[rows] = self.drag_start_position[:, 0] + self.drag_offset[0]
+        nodes.y[rows] = self.drag_start_position[:, 1] + self.drag_offset[1]
+        nodes.px[rows], nodes.py[rows] = self.to_projected_coordinates(
+                                                    nodes.x[rows], nodes.y[rows])
+        nodes.longitude[rows], nodes.latitude[rows] = self.projections[self.proj](
+                                    nodes.px[rows], nodes.py[rows], inverse=True)
+        nodes.stale[rows] = True
+        nodes.index.update(rows)
+        self.dtag('drag')
+        self.drag_rows = self.drag_start_position = None
+        self.schedule_labels()
             
     def import_nodes(self):
-        filepath = filedialog.askopenfilenames(filetypes = (('xls files','*.xls'),))
+        # only the file types whose reader is installed are offered
+        filetypes = [('{} files'.format(name), '*.' + name) for name, reader in (
+                                                        ('xls', xlrd), 
+                                                        ('xlsx', openpyxl), 
+                                                        ('csv', csv)
+                                                        ) if reader is not None]
+        filepath = filedialog.askopenfilenames(filetypes = [('node files', 
+                    ' '.join(pattern for _, pattern in filetypes))] + filetypes)
         if not filepath:
             return
         else:
             filepath ,= filepath
-        book = xlrd.open_workbook(filepath)
-        try:
-            sheet = book.sheet_by_index(0)
-        # if the sheet cannot be found, there's nothing to import
-        except xlrd.biffh.XLRDError:
-            warnings.warn('the excel file is empty: import failed')
-        for row_index in range(1, sheet.nrows):
-            x, y = self.to_canvas_coordinates(*sheet.row_values(row_index))
-            self.create_object(x, y)
+        self.load_nodes(filepath)
+        
+    def load_nodes(self, filepath):
+        # the file is read by chunks, scheduled with after() like the 
+        # shapefile streaming, so that the GUI is not frozen
+        self.cancel_node_import()
+        chunks = read_node_chunks(filepath, self.chunk_size)
+        self.node_import = chunks, time.perf_counter(), [0, 0]
+        self.node_job = self.after_idle(self.import_node_chunks)
+        
+    def import_node_chunks(self):
+        chunks, start, counts = self.node_import
+        step_start, step_rows = time.perf_counter(), sum(counts)
+        for coords, progress in chunks:
+            longitudes, latitudes = coords.T
+            # rows that are not valid geographical coordinates are skipped
+            valid = (np.isfinite(coords).all(axis=1) 
+                        & (np.abs(longitudes) <= 180) & (np.abs(latitudes) <= 90))
+            self.create_nodes(longitudes[valid], latitudes[valid])
+            counts[0] += int(valid.sum())
+            counts[1] += int((~valid).sum())
+            if time.perf_counter() - step_start > self.time_slice:
+                self.stats.record('import_nodes', time.perf_counter() - step_start,
+                                                    rows=sum(counts) - step_rows)
+                self.set_import_status('{} nodes imported ({:.0%})'
+                                                    .format(counts[0], progress))
+                self.node_job = self.after(1, self.import_node_chunks)
+                return
+        self.stats.record('import_nodes', time.perf_counter() - step_start,
+                                                    rows=sum(counts) - step_rows)
+        duration = time.perf_counter() - start
+        self.node_import = self.node_job = None
+        if counts[1]:
+            warnings.warn('{} invalid rows were skipped'.format(counts[1]))
+        self.set_import_status('{} nodes imported ({:.0f} rows/s)'.format(
+                            counts[0], sum(counts)/max(duration, 1e-9)))
+        
+    def cancel_node_import(self):
+        if self.node_job:
+            self.after_cancel(self.node_job)
+            self.node_import[0].close()
+        self.node_import = self.node_job = None
+        
+    def set_import_status(self, text):
+        self.controller.menu.import_status['text'] = text
+        
+    def create_nodes(self, longitudes, latitudes):
+        # vectorized counterpart of create_object, for nodes given by their
+        # geographical coordinates: they are projected with a single call
+        px, py = self.projections[self.proj](longitudes, latitudes)
+        x, y = px*self.ratio + self.offset[0], -py*self.ratio + self.offset[1]
+        ids = [self.create_image(x, y, image=self.controller.node_image, 
+                tags=('node',)) for x, y in zip(x.tolist(), y.tolist())]
+        self.schedule_labels()
+        return self.node_id_to_node.extend(ids, x, y, longitudes, latitudes, px, py)
+        
+class ImageCanvas(MapGeometry):
+    
+    # drawing methods of the canvas used by the map, implemented on a Pillow
+    # image: the base layer is rasterized with the same code as the polygons
+    
+    def __init__(self, ratio, offset, size, colors):
+        self.ratio, self.offset = ratio, offset
+        self.colors = colors
+        self.image = Image.new('RGB', size, colors['white'])
+        self.draw = ImageDraw.Draw(self.image)
+        
+    def create_polygon(self, coords, fill, outline, tags=()):
+        self.draw.polygon(coords, fill=self.colors[fill], outline=self.colors[outline])
+        
+    def create_rectangle(self, x0, y0, x1, y1, fill, outline, tags=()):
+        self.create_polygon([x0, y0, x1, y0, x1, y1, x0, y1], fill, outline)
+        
+    def create_oval(self, x0, y0, x1, y1, fill, outline, tags=()):
+        width, height = self.image.size
+        if max(x1 - x0, y1 - y0) < 4*max(width, height):
+            self.draw.ellipse((x0, y0, x1, y1), fill=self.colors[fill], 
+                                                outline=self.colors[outline])
+            return
+        # Pillow computes the whole ellipse, even outside of the image: large
+        # ellipses (e.g the globe, zoomed in) are drawn as polygons instead, 
+        # clipped to the image, with an error below half a pixel
+        radius = (x1 - x0)/2
+        count = int(np.pi/np.arccos(1 - 0.5/radius)) + 1
+        angles = np.linspace(0, 2*np.pi, count, endpoint=False)
+        circle = shapely.Polygon(np.column_stack((
+                                        (x0 + x1)/2 + radius*np.cos(angles), 
+                                        (y0 + y1)/2 + radius*np.sin(angles)
+                                        )))
+        clipped = shapely.clip_by_rect(circle, -2, -2, width + 2, height + 2)
+        for polygon in shapely.get_parts(clipped):
+            if polygon.geom_type == 'Polygon' and not polygon.is_empty:
+                self.create_polygon(shapely.get_coordinates(
+                        polygon.exterior).ravel().tolist(), fill, outline)
+        
+class LayerLoader(MapGeometry):
+    
+    # used by the worker processes of the layer pool to read and project 
+    # the layers
+    
+    def __init__(self, cache_dir):
+        # the cache on the disk is shared with the GUI
+        self.cache = GeometryCache(cache_dir)
+        
+def load_layer(filepath, proj, cache_dir):
+    # runs in a worker process: levels of detail of a shapefile
+    loader = LayerLoader(cache_dir)
+    return loader.compute_levels(filepath, loader.projections[proj])
         
 if str.__eq__(__name__, '__main__'):
     controller = Controller(path_app)
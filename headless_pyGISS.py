@@ -0,0 +1,151 @@
+import argparse
+import numpy as np
+import time
+from concurrent.futures import ProcessPoolExecutor
+from os import makedirs
+from os.path import basename, join, splitext
+from PIL import Image, ImageDraw
+from extended_pyGISS import MapGeometry, read_node_chunks
+
+# tk colors used by the map, and their RGB equivalent for Pillow and SVG
+colors = {
+          'black': '#000000',
+          'deep sky blue': '#00bfff',
+          'green3': '#00cd00',
+          'red': '#ff0000'
+          }
+
+class HeadlessMap(MapGeometry):
+
+    # the geometry pipeline of the GUI is reused as is: only the canvas
+    # methods are reimplemented, to draw in a Pillow image or an SVG file
+
+    def __init__(self, filepath, proj='Mercator', size=(1300, 800), fmt='png'):
+        self.filepath = filepath
+        self.proj = proj
+        self.width, self.height = size
+        self.format = fmt
+        self.ratio, self.offset = 1, (0, 0)
+        if fmt == 'png':
+            self.image = Image.new('RGB', size, 'white')
+            self.draw = ImageDraw.Draw(self.image)
+        else:
+            self.elements = []
+
+    def fit(self, coords):
+        # the ratio and offset are chosen so that the map fills the image
+        x, y = coords[:, 0], -coords[:, 1]
+        if self.proj == 'Mercator':
+            # like the water, the land is cut at 84 degrees of latitude
+            _, y_min = self.to_canvas_coordinates(0, 84)
+            _, y_max = self.to_canvas_coordinates(0, -84)
+            y = np.clip(y, y_min, y_max)
+        x_min, x_max, y_min, y_max = x.min(), x.max(), y.min(), y.max()
+        self.ratio = 0.95*min(
+                              self.width/max(x_max - x_min, 1),
+                              self.height/max(y_max - y_min, 1)
+                              )
+        self.offset = (
+                       self.width/2 - self.ratio*(x_min + x_max)/2,
+                       self.height/2 - self.ratio*(y_min + y_max)/2
+                       )
+
+    def render(self, nodes=None):
+        coords, bounds, exterior = self.read_shapefile(self.filepath)
+        if len(coords):
+            self.fit(coords)
+        self.draw_water()
+        for ring in range(len(bounds) - 1):
+            self.draw_ring(coords, bounds, exterior, ring)
+        if nodes is not None:
+            # nodes that cannot be projected (e.g the hidden side of the globe
+            # with the orthographic projection) are not drawn
+            x, y = self.to_canvas_coordinates(*nodes)
+            visible = np.isfinite(x) & np.isfinite(y)
+            for x, y in zip(x[visible], y[visible]):
+                self.create_oval(x - 4, y - 4, x + 4, y + 4,
+                                            outline='black', fill='red')
+        return len(bounds) - 1
+
+    def save(self, filepath):
+        if self.format == 'png':
+            self.image.save(filepath)
+            return
+        with open(filepath, 'w') as file:
+            file.write('<svg xmlns="http://www.w3.org/2000/svg" '
+                       'width="{0}" height="{1}" viewBox="0 0 {0} {1}">\n'
+                       .format(self.width, self.height))
+            file.write('<rect width="100%" height="100%" fill="white"/>\n')
+            file.write('\n'.join(self.elements))
+            file.write('\n</svg>\n')
+
+    def create_polygon(self, coords, fill, outline, tags=()):
+        if self.format == 'png':
+            self.draw.polygon(coords, fill=colors[fill], outline=colors[outline])
+        else:
+            points = ' '.join('{:.1f},{:.1f}'.format(*point)
+                                        for point in zip(coords[::2], coords[1::2]))
+            self.elements.append('<polygon points="{}" fill="{}" stroke="{}"/>'
+                                .format(points, colors[fill], colors[outline]))
+
+    def create_rectangle(self, x0, y0, x1, y1, fill, outline, tags=()):
+        self.create_polygon([x0, y0, x1, y0, x1, y1, x0, y1], fill, outline)
+
+    def create_oval(self, x0, y0, x1, y1, fill, outline, tags=()):
+        if self.format == 'png':
+            self.draw.ellipse((x0, y0, x1, y1),
+                                    fill=colors[fill], outline=colors[outline])
+        else:
+            self.elements.append(('<ellipse cx="{:.1f}" cy="{:.1f}" rx="{:.1f}" '
+                                  'ry="{:.1f}" fill="{}" stroke="{}"/>').format(
+                                   (x0 + x1)/2, (y0 + y1)/2, (x1 - x0)/2,
+                                   (y1 - y0)/2, colors[fill], colors[outline]))
+
+def read_nodes(filepath):
+    # same formats as the GUI import: longitude and latitude in the first two
+    # columns of a CSV file, or of the first sheet of an Excel file
+    coords = np.concatenate([np.empty((0, 2))] + [chunk for chunk, _ 
+                                        in read_node_chunks(filepath, 100000)])
+    return coords[np.isfinite(coords).all(axis=1)].T
+
+def render_job(job):
+    shapefile, output, proj, size, fmt, nodes = job
+    headless_map = HeadlessMap(shapefile, proj, size, fmt)
+    rings = headless_map.render(read_nodes(nodes) if nodes else None)
+    headless_map.save(output)
+    return output, rings
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(
+                description='Render shapefiles to PNG or SVG without a display')
+    parser.add_argument('shapefiles', nargs='+', help='shapefiles to render')
+    parser.add_argument('-o', '--output', default='.', help='output folder')
+    parser.add_argument('-f', '--format', choices=('png', 'svg'), default='png')
+    parser.add_argument('-p', '--projection', choices=tuple(MapGeometry.projections),
+                                                            default='Mercator')
+    parser.add_argument('-s', '--size', nargs=2, type=int, default=(1300, 800),
+                                                metavar=('WIDTH', 'HEIGHT'))
+    parser.add_argument('-n', '--nodes', 
+                            help='xls, xlsx or csv file of nodes to overlay')
+    parser.add_argument('-j', '--processes', type=int, default=None,
+                            help='number of worker processes (default: all cores)')
+    args = parser.parse_args(arguments)
+    makedirs(args.output, exist_ok=True)
+    jobs = [(
+             shapefile,
+             join(args.output, splitext(basename(shapefile))[0] + '.' + args.format),
+             args.projection,
+             tuple(args.size),
+             args.format,
+             args.nodes
+             ) for shapefile in args.shapefiles]
+    start = time.perf_counter()
+    with ProcessPoolExecutor(args.processes) as pool:
+        for output, rings in pool.map(render_job, jobs):
+            print('{} ({} polygons)'.format(output, rings))
+    duration = time.perf_counter() - start
+    print('{} maps rendered in {:.2f}s ({:.2f} maps/s)'.format(
+                                        len(jobs), duration, len(jobs)/duration))
+
+if str.__eq__(__name__, '__main__'):
+    main()
@@ -1,8 +1,8 @@
 import tkinter as tk
 from tkinter import filedialog
+import numpy as np
 import pyproj
 import shapefile
-import shapely.geometry
 
 class Map(tk.Canvas):
 
@@ -42,18 +42,26 @@ class Map(tk.Canvas):
     def draw_map(self):
         self.delete('land', 'water')
         self.draw_water()
-        sf = shapefile.Reader(self.filepath)       
-        polygons = sf.shapes() 
-        for polygon in polygons:
-            polygon = shapely.geometry.shape(polygon)
-            if polygon.geom_type == 'Polygon':
-                polygon = [polygon]
-            for land in polygon:
-                land = str(land)[10:-2].replace(', ', ',').replace(' ', ',')
-                coords = land.replace('(', '').replace(')', '').split(',')
-                self.create_polygon(sum((self.to_canvas_coordinates(*c) 
-                                for c in zip(coords[0::2], coords[1::2])), ()),    
-                                fill='green3', outline='black', tags=('land',))
+        shapes = [s for s in shapefile.Reader(self.filepath).shapes() if s.points]
+        if not shapes: return
+        # large shapes first, so that enclaves are drawn above their container
+        shapes.sort(key=lambda s: -(s.bbox[2] - s.bbox[0])*(s.bbox[3] - s.bbox[1]))
+        # all vertices are projected at once with a single vectorized call
+        points = np.concatenate([np.asarray(s.points)[:, :2] for s in shapes])
+        x, y = self.to_canvas_coordinates(*points.T)
+        start = 0
+        for shape in shapes:
+            bounds = [start + i for i in shape.parts] + [start + len(shape.points)]
+            start = bounds[-1]
+            for i, j in zip(bounds, bounds[1:]):
+                lon, lat = points[i:j].T
+                # exterior rings are clockwise, holes (lakes) counterclockwise
+                hole = np.dot(lon[:-1], lat[1:]) > np.dot(lon[1:], lat[:-1])
+                ring = np.column_stack((x[i:j], y[i:j]))
+                ring = ring[np.isfinite(ring).all(axis=1)]
+                if len(ring) > 2:
+                    self.create_polygon(ring.ravel().tolist(), outline='black', 
+                        fill='deep sky blue' if hole else 'green3', tags=('land',))
 
     def draw_water(self):
         if self.proj == 'mercator':
@@ -0,0 +1,154 @@
+import argparse
+import glob
+import json
+import numpy as np
+import os
+import pyproj
+import shapely
+import time
+from concurrent.futures import ProcessPoolExecutor
+from math import floor
+from os.path import basename, exists, join, splitext
+from PIL import Image, ImageDraw
+from extended_pyGISS import ShpReader
+from headless_pyGISS import HeadlessMap, colors
+
+# half of the width of the world in web mercator (EPSG:3857), in meters
+extent = 20037508.342789244
+
+tile_size = 256
+
+class TileRenderer(HeadlessMap):
+
+    # XYZ tiles are defined in web mercator, the spherical variant of the
+    # mercator projection (EPSG:3395) of the GUI
+    projections = {'Web Mercator': pyproj.Proj('epsg:3857')}
+
+    def __init__(self, filepath):
+        super().__init__(filepath, 'Web Mercator', (tile_size, tile_size))
+        self.layer = self.read_shapefile(self.filepath)
+        # (zoom level -> (simplified layer, spatial index of its rings))
+        self.levels = {}
+
+    def level(self, zoom):
+        if zoom not in self.levels:
+            # the layer is simplified with a tolerance of one pixel
+            layer = self.simplify_layer(self.layer, 2*extent/2**zoom/tile_size)
+            self.levels[zoom] = layer, self.ring_index(layer)
+        return self.levels[zoom]
+
+    def render_tile(self, zoom, x, y):
+        (coords, bounds, exterior), tree = self.level(zoom)
+        size = 2*extent/2**zoom
+        x_min, y_max = -extent + x*size, extent - y*size
+        x_max, y_min = x_min + size, y_max - size
+        self.ratio = tile_size/size
+        self.offset = -x_min*self.ratio, y_max*self.ratio
+        self.image = Image.new('RGB', (tile_size, tile_size), colors['deep sky blue'])
+        self.draw = ImageDraw.Draw(self.image)
+        # only the rings that intersect the tile are clipped and drawn, in
+        # the order of the layer (holes and enclaves after their container)
+        rings = np.sort(tree.query(shapely.box(x_min, y_min, x_max, y_max)))
+        if not len(rings):
+            return self.image
+        polygons = shapely.polygons([shapely.linearrings(
+                            coords[bounds[ring]:bounds[ring + 1]]) for ring in rings])
+        # the clipping rectangle is slightly larger than the tile, so that
+        # the borders of the clipped polygons are not drawn on the tile edges
+        margin = 2/self.ratio
+        clipped = shapely.clip_by_rect(polygons, x_min - margin, y_min - margin,
+                                                x_max + margin, y_max + margin)
+        for ring, geometry in zip(rings, clipped):
+            for polygon in shapely.get_parts(geometry):
+                if polygon.geom_type != 'Polygon' or polygon.is_empty:
+                    continue
+                px, py = shapely.get_coordinates(polygon.exterior).T
+                self.create_polygon(
+                    np.column_stack((
+                                     px*self.ratio + self.offset[0],
+                                     -py*self.ratio + self.offset[1]
+                                     )).ravel().tolist(),
+                    fill = 'green3' if exterior[ring] else 'deep sky blue',
+                    outline = 'black'
+                    )
+        return self.image
+
+def tile_range(zoom, bbox):
+    # tiles that intersect a (longitude, latitude) bounding box
+    projection = TileRenderer.projections['Web Mercator']
+    longitude_min, latitude_min, longitude_max, latitude_max = bbox
+    x_min, y_min = projection(longitude_min, max(latitude_min, -85.0511))
+    x_max, y_max = projection(longitude_max, min(latitude_max, 85.0511))
+    size, count = 2*extent/2**zoom, 2**zoom
+    clamp = lambda value: min(max(value, 0), count - 1)
+    for x in range(clamp(floor((x_min + extent)/size)),
+                                    clamp(floor((x_max + extent)/size)) + 1):
+        for y in range(clamp(floor((extent - y_max)/size)),
+                                    clamp(floor((extent - y_min)/size)) + 1):
+            yield zoom, x, y
+
+def init_worker(filepath, output):
+    global renderer, output_dir
+    renderer, output_dir = TileRenderer(filepath), output
+
+def render_job(tile):
+    zoom, x, y = tile
+    os.makedirs(join(output_dir, str(zoom), str(x)), exist_ok=True)
+    renderer.render_tile(zoom, x, y).save(tile_path(output_dir, *tile))
+
+def tile_path(output, zoom, x, y):
+    return join(output, str(zoom), str(x), '{}.png'.format(y))
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description='Generate XYZ tiles of a shapefile')
+    parser.add_argument('shapefile', help='shapefile to cut into tiles')
+    parser.add_argument('-o', '--output', default='tiles', help='output folder')
+    parser.add_argument('-z', '--zoom', nargs=2, type=int, default=(0, 5),
+                                                    metavar=('MIN', 'MAX'))
+    parser.add_argument('-b', '--bbox', nargs=4, type=float, default=None,
+          metavar=('LON_MIN', 'LAT_MIN', 'LON_MAX', 'LAT_MAX'),
+          help='area to seed (default: the bounding box of the shapefile)')
+    parser.add_argument('-j', '--processes', type=int, default=None,
+                            help='number of worker processes (default: all cores)')
+    args = parser.parse_args(arguments)
+    output = join(args.output, splitext(basename(args.shapefile))[0])
+    os.makedirs(output, exist_ok=True)
+    bbox = args.bbox
+    if not bbox:
+        bbox = ShpReader(args.shapefile).bbox
+    # tiles rendered from the same version of the shapefile are not rendered
+    # again: the version is stored in a manifest in the output folder
+    stat = os.stat(args.shapefile)
+    source = [stat.st_mtime_ns, stat.st_size]
+    manifest = join(output, 'manifest.json')
+    try:
+        with open(manifest) as file:
+            up_to_date = json.load(file)['source'] == source
+    except (OSError, ValueError, KeyError):
+        up_to_date = False
+    tiles = [tile for zoom in range(args.zoom[0], args.zoom[1] + 1)
+                                    for tile in tile_range(zoom, bbox)]
+    if up_to_date:
+        tiles = [tile for tile in tiles if not exists(tile_path(output, *tile))]
+    else:
+        # the manifest covers every tile of the folder, whatever the zoom 
+        # levels and area of the run that rendered it: tiles rendered from
+        # another version of the shapefile are deleted
+        for path in glob.glob(join(output, '*', '*', '*.png')):
+            os.remove(path)
+    start = time.perf_counter()
+    with ProcessPoolExecutor(
+                             args.processes,
+                             initializer = init_worker,
+                             initargs = (args.shapefile, output)
+                             ) as pool:
+        for _ in pool.map(render_job, tiles, chunksize=16):
+            pass
+    duration = time.perf_counter() - start
+    with open(manifest, 'w') as file:
+        json.dump({'source': source}, file)
+    print('{} tiles rendered in {:.2f}s ({:.1f} tiles/s)'.format(
+                                len(tiles), duration, len(tiles)/max(duration, 1e-9)))
+
+if str.__eq__(__name__, '__main__'):
+    main()